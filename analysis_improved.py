@@ -1,53 +1,29 @@
 # -*- coding: utf-8 -*-
+"""
+Book classification benchmark - hybrid semantic approach (centroid + K-NN).
+
+    python analysis_improved.py                      # single split, k=5, alpha=0.6, beta=0.4
+    python analysis_improved.py --sweep --workers 4  # grid over (k, alpha, beta) -> sweep_results.csv
+    python analysis_improved.py --cv 5 --workers 5   # stratified 5-fold CV, mean and std
+"""
+import argparse
 import sys
-import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report, precision_score, f1_score
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from data_cleaning import load_catalogue
+from embedding_store import MODEL_NAME, load_or_build_store, store_path
+from encoder_backend import load_encoder
+from hybrid_classifier import HybridClassifier, cross_validate, save_table, sweep_grid
+from metrics import configure_logging
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
-print("="*80)
-print("BOOK CLASSIFICATION - HYBRID SEMANTIC APPROACH")
-print("="*80)
-
-# =============================================================================
-# STEP 1: LOAD AND PREPARE DATA
-# =============================================================================
-print("\n[STEP 1/6] Loading and cleaning dataset...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-dataset = pd.read_csv('Book_Dataset_1.csv', sep=',', encoding='latin1')
-dataset = dataset.drop_duplicates()
-
-# Remove invalid categories
-dataset = dataset[
-    (dataset['Category'].str.strip() != '') &
-    (dataset['Category'].str.lower() != 'default') &
-    (dataset['Category'].str.lower() != 'add a comment')
-]
-
-print(f"[OK] {len(dataset)} books loaded")
-
-# =============================================================================
-# STEP 2: SMART CATEGORY GROUPING
-# =============================================================================
-print("\n[STEP 2/6] Grouping similar categories...")
-
-def clean_text(text):
-    if pd.isna(text):
-        return ''
-    return str(text).lower().strip()
-
-dataset['category_clean'] = dataset['Category'].apply(clean_text)
-
 # Category mapping
-category_mapping = {
+CATEGORY_MAPPING = {
     # Fiction genres
     'fiction': 'fiction',
     'historical fiction': 'fiction',
@@ -117,130 +93,203 @@ category_mapping = {
     'christian': 'spirituality',
 }
 
-dataset['category_grouped'] = dataset['category_clean'].map(
-    lambda x: category_mapping.get(x, 'other')
-)
-
 # Keep only categories with enough books
-min_books = 20
-grouped_counts = dataset['category_grouped'].value_counts()
-valid_categories = grouped_counts[grouped_counts >= min_books].index
-dataset = dataset[dataset['category_grouped'].isin(valid_categories)]
-dataset = dataset.reset_index(drop=True)
-
-print(f"[OK] {len(valid_categories)} final categories with >={min_books} books")
-print(f"[OK] {len(dataset)} books retained")
-
-# =============================================================================
-# STEP 3: GENERATE SEMANTIC EMBEDDINGS
-# =============================================================================
-print("\n[STEP 3/6] Generating semantic embeddings...")
-
-dataset['title_clean'] = dataset['Title'].apply(clean_text)
-dataset['description_clean'] = dataset['Book_Description'].apply(clean_text)
-dataset['text_for_embedding'] = (
-    dataset['title_clean'] + ' ' + dataset['description_clean']
-)
-
-embeddings = model.encode(
-    dataset['text_for_embedding'].tolist(),
-    convert_to_tensor=True,
-    show_progress_bar=True
-)
-
-X_all = embeddings.cpu().numpy()
-y_all = dataset['category_grouped']
-
-# Normalize
-scaler = StandardScaler()
-X_all = scaler.fit_transform(X_all)
-
-print(f"[OK] Embeddings shape: {X_all.shape}")
-
-# =============================================================================
-# STEP 4: TRAIN/TEST SPLIT & CREATE CATEGORY PROFILES
-# =============================================================================
-print("\n[STEP 4/6] Splitting data and creating category profiles...")
-
-indices = np.arange(len(dataset))
-idx_train, idx_test = train_test_split(
-    indices, 
-    test_size=0.25,
-    random_state=42, 
-    stratify=y_all
-)
-
-# Create category profiles (centroids)
-category_profiles = {}
-for category in dataset.iloc[idx_train]['category_grouped'].unique():
-    category_mask = dataset.iloc[idx_train]['category_grouped'] == category
-    train_indices_for_cat = idx_train[category_mask[idx_train]]
-    category_embeddings = X_all[train_indices_for_cat]
-    category_profiles[category] = np.mean(category_embeddings, axis=0)
-
-X_train = X_all[idx_train]
-y_train = dataset.iloc[idx_train]['category_grouped'].values
-y_test = dataset.iloc[idx_test]['category_grouped'].values
-
-print(f"[OK] Train: {len(idx_train)} | Test: {len(idx_test)}")
-print(f"[OK] {len(category_profiles)} category profiles created")
-
-# =============================================================================
-# STEP 5: HYBRID PREDICTION (CENTROID + K-NN)
-# =============================================================================
-print("\n[STEP 5/6] Running hybrid prediction...")
-
-k = 5  # Number of neighbors
-alpha = 0.6  # Weight for centroid
-beta = 0.4   # Weight for K-NN
-
-y_pred_hybrid = []
-
-for idx in idx_test:
-    query_embedding = X_all[idx].reshape(1, -1)
-    
-    # Centroid scores
-    centroid_scores = {}
-    for category, profile in category_profiles.items():
-        similarity = cosine_similarity(query_embedding, profile.reshape(1, -1))[0][0]
-        centroid_scores[category] = similarity
-    
-    # K-NN scores
-    similarities = cosine_similarity(query_embedding, X_train)[0]
-    top_k_indices = np.argsort(similarities)[-k:][::-1]
-    neighbors_categories = y_train[top_k_indices]
-    
-    knn_scores = {}
-    for cat in category_profiles.keys():
-        knn_scores[cat] = (neighbors_categories == cat).sum() / k
-    
-    # Hybrid combination
-    hybrid_scores = {}
-    for cat in category_profiles.keys():
-        hybrid_scores[cat] = alpha * centroid_scores[cat] + beta * knn_scores[cat]
-    
-    predicted_category = max(hybrid_scores.items(), key=lambda x: x[1])[0]
-    y_pred_hybrid.append(predicted_category)
-
-# =============================================================================
-# STEP 6: EVALUATION
-# =============================================================================
-print("\n" + "="*80)
-print("RESULTS")
-print("="*80)
-
-accuracy = accuracy_score(y_test, y_pred_hybrid)
-precision = precision_score(y_test, y_pred_hybrid, average='weighted', zero_division=0)
-f1 = f1_score(y_test, y_pred_hybrid, average='weighted', zero_division=0)
-
-print(f"\n[STEP 6/6] Hybrid Method (alpha={alpha}, beta={beta}, K={k})")
-print(f"   Accuracy:  {accuracy:.4f} ({accuracy*100:.2f}%)")
-print(f"   Precision: {precision:.4f}")
-print(f"   F1-Score:  {f1:.4f}")
-
-print("\nDetailed Classification Report:")
-print(classification_report(y_test, y_pred_hybrid, zero_division=0))
-
-print("\n" + "="*80)
-print("[SUCCESS] CLASSIFICATION COMPLETE")
-print("="*80)
+MIN_BOOKS = 20
+
+# Text recipe of the classification embeddings (store key, with the model name)
+TEXT_RECIPE = "title_desc"
+
+
+def parse_values(text, cast=float):
+    """Comma-separated list of values ("1,3,5")"""
+    return [cast(value) for value in text.split(',') if value.strip()]
+
+
+def load_dataset():
+    """STEP 1: shared cleaned snapshot (duplicates and invalid categories removed)"""
+    print("\n[STEP 1/6] Loading and cleaning dataset...")
+    dataset = load_catalogue('Book_Dataset_1.csv')
+    print(f"[OK] {len(dataset)} books loaded")
+    return dataset
+
+
+def group_categories(dataset, min_books=MIN_BOOKS):
+    """STEP 2: map categories to broader groups and drop groups that are too small"""
+    print("\n[STEP 2/6] Grouping similar categories...")
+    
+    dataset['category_clean'] = dataset['genre_clean']
+    dataset['category_grouped'] = dataset['category_clean'].map(
+        lambda x: CATEGORY_MAPPING.get(x, 'other')
+    )
+    
+    grouped_counts = dataset['category_grouped'].value_counts()
+    valid_categories = grouped_counts[grouped_counts >= min_books].index
+    dataset = dataset[dataset['category_grouped'].isin(valid_categories)]
+    dataset = dataset.reset_index(drop=True)
+    
+    print(f"[OK] {len(valid_categories)} final categories with >={min_books} books")
+    print(f"[OK] {len(dataset)} books retained")
+    return dataset
+
+
+def embed_dataset(dataset, model):
+    """
+    STEP 3: semantic embeddings (title + description), standardized.
+    Vectors come from the embedding store (keyed by text recipe and model):
+    only new or modified books are encoded.
+    """
+    print("\n[STEP 3/6] Generating semantic embeddings...")
+    
+    dataset['text_for_embedding'] = (
+        dataset['title_clean'] + ' ' + dataset['desc_clean']
+    )
+    
+    def encode(texts):
+        return model.encode(
+            texts,
+            convert_to_tensor=False,
+            show_progress_bar=True,
+            batch_size=32
+        )
+    
+    embeddings = load_or_build_store(
+        dataset['text_for_embedding'].tolist(), encode,
+        path=store_path(TEXT_RECIPE, MODEL_NAME),
+        model_name=MODEL_NAME
+    )
+    
+    X_all = np.asarray(embeddings)
+    
+    # Normalize
+    scaler = StandardScaler()
+    X_all = scaler.fit_transform(X_all)
+    
+    print(f"[OK] Embeddings shape: {X_all.shape}")
+    return X_all
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Book classification - hybrid semantic approach")
+    parser.add_argument('--k', type=int, default=5, help="Number of neighbors")
+    parser.add_argument('--alpha', type=float, default=0.6, help="Weight for centroid")
+    parser.add_argument('--beta', type=float, default=0.4, help="Weight for K-NN")
+    parser.add_argument('--sweep', action='store_true',
+                        help="Evaluate a (k, alpha, beta) grid from cached similarities")
+    parser.add_argument('--k-values', default="1,3,5,7,10,15")
+    parser.add_argument('--alphas', default="0.0,0.2,0.4,0.6,0.8,1.0")
+    parser.add_argument('--betas', default="0.0,0.2,0.4,0.6,0.8,1.0")
+    parser.add_argument('--cv', type=int, metavar='N',
+                        help="Stratified N-fold cross-validation instead of a single split")
+    parser.add_argument('--workers', type=int, default=1, help="Processes for the sweep grid or the CV folds")
+    parser.add_argument('--output', default="sweep_results.csv", help="Sweep table (.csv or .json)")
+    args = parser.parse_args()
+    configure_logging()
+    
+    print("="*80)
+    print("BOOK CLASSIFICATION - HYBRID SEMANTIC APPROACH")
+    print("="*80)
+    
+    # =========================================================================
+    # STEP 1-3: DATA, CATEGORIES, EMBEDDINGS
+    # =========================================================================
+    dataset = group_categories(load_dataset())
+    # Loaded lazily: only used if the store is missing or out of date
+    model = load_encoder(MODEL_NAME)
+    X_all = embed_dataset(dataset, model)
+    y_all = dataset['category_grouped']
+    
+    if args.cv:
+        # =====================================================================
+        # STEP 4-6: STRATIFIED K-FOLD CROSS-VALIDATION (folds run concurrently)
+        # =====================================================================
+        print(f"\n[STEP 4/6] Stratified {args.cv}-fold cross-validation ({args.workers} worker(s))...")
+        table, summary = cross_validate(
+            X_all, y_all.values, n_splits=args.cv, k=args.k, alpha=args.alpha, beta=args.beta,
+            workers=args.workers
+        )
+        
+        print(f"\n[STEP 5/6] Per-fold results (alpha={args.alpha}, beta={args.beta}, K={args.k})")
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        
+        print(f"\n[STEP 6/6] Mean +/- std over {args.cv} folds")
+        for metric, (mean, std) in summary.items():
+            print(f"   {metric.capitalize() + ':':10} {mean:.4f} +/- {std:.4f}")
+        return
+    
+    # =========================================================================
+    # STEP 4: TRAIN/TEST SPLIT & CREATE CATEGORY PROFILES
+    # =========================================================================
+    print("\n[STEP 4/6] Splitting data and creating category profiles...")
+    
+    indices = np.arange(len(dataset))
+    idx_train, idx_test = train_test_split(
+        indices, 
+        test_size=0.25,
+        random_state=42, 
+        stratify=y_all
+    )
+    
+    X_train = X_all[idx_train]
+    y_train = dataset.iloc[idx_train]['category_grouped'].values
+    y_test = dataset.iloc[idx_test]['category_grouped'].values
+    
+    k = args.k  # Number of neighbors
+    alpha = args.alpha  # Weight for centroid
+    beta = args.beta   # Weight for K-NN
+    
+    # Category profiles (centroids) stacked into one matrix
+    classifier = HybridClassifier(k=k, alpha=alpha, beta=beta).fit(X_train, y_train)
+    
+    print(f"[OK] Train: {len(idx_train)} | Test: {len(idx_test)}")
+    print(f"[OK] {len(classifier.classes_)} category profiles created")
+    
+    if args.sweep:
+        # =====================================================================
+        # STEP 5-6: HYPER-PARAMETER SWEEP (similarities computed once)
+        # =====================================================================
+        ks = parse_values(args.k_values, int)
+        alphas = parse_values(args.alphas)
+        betas = parse_values(args.betas)
+        print(f"\n[STEP 5/6] Sweeping {len(ks) * len(alphas) * len(betas)} (k, alpha, beta) combinations...")
+        table = sweep_grid(classifier, X_all[idx_test], y_test, ks, alphas, betas, workers=args.workers)
+        save_table(table, args.output)
+        
+        print("\n[STEP 6/6] Best combinations (weighted F1)")
+        print(table.head(10).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        print(f"\n[OK] {len(table)} results saved to {args.output}")
+        return
+    
+    # =========================================================================
+    # STEP 5: HYBRID PREDICTION (CENTROID + K-NN)
+    # =========================================================================
+    print("\n[STEP 5/6] Running hybrid prediction...")
+    
+    # Centroid and K-NN similarities as chunked matrix products (see hybrid_classifier.py)
+    y_pred_hybrid = classifier.predict(X_all[idx_test])
+    
+    # =========================================================================
+    # STEP 6: EVALUATION
+    # =========================================================================
+    print("\n" + "="*80)
+    print("RESULTS")
+    print("="*80)
+    
+    accuracy = accuracy_score(y_test, y_pred_hybrid)
+    precision = precision_score(y_test, y_pred_hybrid, average='weighted', zero_division=0)
+    f1 = f1_score(y_test, y_pred_hybrid, average='weighted', zero_division=0)
+    
+    print(f"\n[STEP 6/6] Hybrid Method (alpha={alpha}, beta={beta}, K={k})")
+    print(f"   Accuracy:  {accuracy:.4f} ({accuracy*100:.2f}%)")
+    print(f"   Precision: {precision:.4f}")
+    print(f"   F1-Score:  {f1:.4f}")
+    
+    print("\nDetailed Classification Report:")
+    print(classification_report(y_test, y_pred_hybrid, zero_division=0))
+    
+    print("\n" + "="*80)
+    print("[SUCCESS] CLASSIFICATION COMPLETE")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
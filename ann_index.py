@@ -0,0 +1,401 @@
+"""
+Index de plus proches voisins approximatifs (ANN) pour les embeddings des livres.
+
+Trois implémentations interchangeables, construites à partir de la matrice
+normalisée retournée par load_sbert_and_embeddings() :
+- ExactIndex : parcours complet (référence, et repli par défaut)
+- IVFIndex   : index inversé par k-means, en NumPy pur
+- HNSWIndex  : graphe HNSW via la librairie optionnelle hnswlib
+
+Toutes exposent search(query_emb, top_k, exclude=None) -> (indices,
+similarités cosinus), ce qui permet d'appliquer ensuite la pondération EF3.1
+(0.8 / 0.2) aux seuls candidats retournés. exclude est un pré-filtre
+(masque booléen, True = livre exclu, voir metadata_filter.py) : les livres
+exclus ne sont jamais candidats.
+
+Un index sauvegardé n'est réutilisé que s'il a été construit sur les mêmes
+vecteurs (text_hash et modèle du manifeste du store, ou hash des vecteurs)
+avec les mêmes paramètres de construction.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from metrics import timed
+from scoring import GATHER_MAX_FRACTION, normalize_embeddings, scoring_matrix, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # Dépendance optionnelle
+    hnswlib = None
+
+
+class ExactIndex:
+    """Recherche exacte : un produit matrice-vecteur sur tout le catalogue."""
+
+    method = 'exact'
+    # Paramètres de requête : modifiables sans reconstruire l'index
+    query_params = ()
+
+    def __init__(self, embeddings):
+        # Store float16 : converti une fois plutôt qu'à chaque produit
+        self.vectors = scoring_matrix(embeddings)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query_emb, top_k, exact=True, exclude=None):
+        """
+        Retourne les top_k livres les plus similaires à la requête.
+
+        Args:
+            query_emb: Embedding de la requête (dim,)
+            top_k: Nombre de résultats
+            exact: Ignoré (toujours exact)
+            exclude: Masque booléen optionnel (n_livres,), True = livre exclu
+
+        Returns:
+            Tuple (indices, similarités) triés par similarité décroissante
+        """
+        query = normalize_embeddings(query_emb)
+        if exclude is not None:
+            exclude = np.asarray(exclude, dtype=bool)
+            candidates = np.flatnonzero(~exclude)
+            if len(candidates) <= GATHER_MAX_FRACTION * len(exclude):
+                # Filtre sélectif : seules les lignes autorisées sont multipliées
+                with timed('score'):
+                    similarities = self.vectors[candidates] @ query
+                with timed('top_k'):
+                    best = top_k_indices(similarities, top_k)
+                return candidates[best], similarities[best]
+        with timed('score'):
+            similarities = self.vectors @ query
+        with timed('top_k'):
+            indices = top_k_indices(similarities, top_k, exclude)
+        return indices, similarities[indices]
+
+    def _params(self):
+        return {}
+
+    def _meta(self, source):
+        return json.dumps({'method': self.method, 'n_rows': len(self), 'source': source, **self._params()})
+
+    def build_params(self):
+        """Paramètres de construction (ceux qui invalident un index sauvegardé)."""
+        return {key: value for key, value in self._params().items() if key not in self.query_params}
+
+    def save(self, path, source=None):
+        """Sauvegarde les métadonnées de l'index (les vecteurs restent dans le store)."""
+        np.savez(npz_path(path), meta=self._meta(source))
+
+    @classmethod
+    def _load(cls, path, embeddings, meta, arrays):
+        return cls(embeddings)
+
+
+class IVFIndex(ExactIndex):
+    """
+    Index inversé (IVF) : les livres sont répartis en n_lists cellules par
+    k-means sphérique ; une requête ne parcourt que les n_probe cellules
+    dont le centroïde est le plus proche.
+
+    Paramètres de compromis rappel/latence :
+    - n_lists : nombre de cellules (défaut ~ sqrt(n_livres))
+    - n_probe : nombre de cellules parcourues par requête
+    """
+
+    method = 'ivf'
+    query_params = ('n_probe',)
+
+    def __init__(self, embeddings, n_lists=None, n_probe=8, n_iter=10, max_train=50000, seed=0):
+        super().__init__(embeddings)
+        self.n_lists = n_lists or max(1, int(np.sqrt(len(embeddings))))
+        self.n_lists = min(self.n_lists, len(embeddings))
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.max_train = max_train
+        self.seed = seed
+        self.centroids = None
+        self.list_ids = None
+        self.list_offsets = None
+
+    def build(self):
+        """Entraîne les centroïdes et range chaque livre dans sa cellule."""
+        rng = np.random.default_rng(self.seed)
+        n = len(self.vectors)
+        sample = np.asarray(self.vectors)
+        if n > self.max_train:
+            sample = sample[np.sort(rng.choice(n, self.max_train, replace=False))]
+
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=self.n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize_embeddings(sums)
+        self.centroids = centroids
+
+        self._assign()
+        return self
+
+    def _assign(self, chunk_size=65536):
+        assignments = np.empty(len(self.vectors), dtype=np.int32)
+        for start in range(0, len(self.vectors), chunk_size):
+            chunk = self.vectors[start:start + chunk_size]
+            assignments[start:start + chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+        self.list_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, query_emb, top_k, exact=False, n_probe=None, exclude=None):
+        """
+        Recherche approximative dans les n_probe cellules les plus proches.
+
+        Les livres exclus sont retirés des cellules sondées avant le calcul
+        des similarités. Repli sur la recherche exacte si exact=True, si
+        toutes les cellules sont parcourues, ou si les cellules sondées
+        contiennent moins de top_k livres autorisés.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        if exact or n_probe >= self.n_lists:
+            return super().search(query_emb, top_k, exclude=exclude)
+
+        query = normalize_embeddings(query_emb)
+        with timed('ann_probe'):
+            probes = top_k_indices(self.centroids @ query, n_probe)
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes
+            ])
+            if exclude is not None:
+                candidates = candidates[~np.asarray(exclude, dtype=bool)[candidates]]
+        if len(candidates) < top_k:
+            return super().search(query_emb, top_k, exclude=exclude)
+
+        candidates.sort()
+        with timed('score'):
+            similarities = self.vectors[candidates] @ query
+        with timed('top_k'):
+            best = top_k_indices(similarities, top_k)
+        return candidates[best], similarities[best]
+
+    def _params(self):
+        return {'n_lists': self.n_lists, 'n_probe': self.n_probe,
+                'n_iter': self.n_iter, 'max_train': self.max_train, 'seed': self.seed}
+
+    def save(self, path, source=None):
+        np.savez(
+            npz_path(path),
+            meta=self._meta(source),
+            centroids=self.centroids,
+            list_ids=self.list_ids,
+            list_offsets=self.list_offsets,
+        )
+
+    @classmethod
+    def _load(cls, path, embeddings, meta, arrays):
+        index = cls(embeddings, **meta)
+        index.centroids = arrays['centroids']
+        index.list_ids = arrays['list_ids']
+        index.list_offsets = arrays['list_offsets']
+        return index
+
+
+class HNSWIndex(ExactIndex):
+    """
+    Graphe HNSW (hnswlib, produit scalaire sur vecteurs normalisés).
+
+    Paramètres de compromis rappel/latence :
+    - M, ef_construction : qualité du graphe (construction)
+    - ef_search : largeur de la recherche (requête)
+    """
+
+    method = 'hnsw'
+    query_params = ('ef_search',)
+
+    def __init__(self, embeddings, M=16, ef_construction=200, ef_search=64):
+        if hnswlib is None:
+            raise ImportError("hnswlib n'est pas installé (pip install hnswlib)")
+        super().__init__(embeddings)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.graph = None
+
+    def build(self):
+        """Construit le graphe HNSW sur tous les livres."""
+        self.graph = hnswlib.Index(space='ip', dim=self.vectors.shape[1])
+        self.graph.init_index(max_elements=len(self.vectors), M=self.M, ef_construction=self.ef_construction)
+        self.graph.add_items(np.asarray(self.vectors), np.arange(len(self.vectors)))
+        self.graph.set_ef(self.ef_search)
+        return self
+
+    def search(self, query_emb, top_k, exact=False, ef=None, exclude=None):
+        """
+        Recherche approximative dans le graphe (repli exact si exact=True).
+
+        Les livres exclus sont filtrés pendant le parcours du graphe (filtre
+        hnswlib). Un filtre très sélectif (moins de 5% des livres autorisés)
+        passe par la recherche exacte sur les seuls livres autorisés.
+        """
+        allowed = None if exclude is None else ~np.asarray(exclude, dtype=bool)
+        n_allowed = len(self.vectors) if allowed is None else int(allowed.sum())
+        top_k = min(top_k, n_allowed)
+        if exact or top_k <= 0 or n_allowed < 0.05 * len(self.vectors):
+            return super().search(query_emb, top_k, exclude=exclude)
+
+        self.graph.set_ef(max(ef or self.ef_search, top_k))
+        query = normalize_embeddings(query_emb)
+        with timed('ann_probe'):
+            if allowed is None:
+                labels, _ = self.graph.knn_query(query, k=top_k)
+            else:
+                labels, _ = self.graph.knn_query(query, k=top_k, filter=lambda label: bool(allowed[label]))
+        candidates = np.sort(labels[0].astype(np.int64))
+        with timed('score'):
+            similarities = self.vectors[candidates] @ query
+        with timed('top_k'):
+            best = top_k_indices(similarities, top_k)
+        return candidates[best], similarities[best]
+
+    def _params(self):
+        return {'M': self.M, 'ef_construction': self.ef_construction, 'ef_search': self.ef_search}
+
+    def save(self, path, source=None):
+        super().save(path, source)
+        self.graph.save_index(f"{npz_path(path)}.hnsw")
+
+    @classmethod
+    def _load(cls, path, embeddings, meta, arrays):
+        index = cls(embeddings, **meta)
+        index.graph = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+        index.graph.load_index(f"{npz_path(path)}.hnsw", max_elements=len(embeddings))
+        index.graph.set_ef(index.ef_search)
+        return index
+
+
+INDEX_TYPES = {cls.method: cls for cls in (ExactIndex, IVFIndex, HNSWIndex)}
+
+
+def npz_path(path):
+    """Chemin du fichier d'index avec l'extension .npz (ajoutée par np.savez)."""
+    return path if path.endswith('.npz') else f"{path}.npz"
+
+
+def source_fingerprint(embeddings, manifest=None):
+    """
+    Empreinte des vecteurs indexés.
+
+    Args:
+        embeddings: Matrice normalisée (n_livres, dim)
+        manifest: Manifeste du store (embedding_store.read_manifest) ; sans
+                  manifeste, les vecteurs sont hachés
+
+    Returns:
+        Dictionnaire comparé au rechargement de l'index
+    """
+    if manifest and manifest.get('text_hash'):
+        return {'text_hash': manifest['text_hash'], 'model_name': manifest.get('model_name'),
+                'dtype': manifest.get('dtype')}
+    digest = hashlib.sha256(np.ascontiguousarray(embeddings).tobytes()).hexdigest()
+    return {'vectors_hash': digest}
+
+
+def build_index(embeddings, method='exact', **params):
+    """
+    Construit un index de recherche sur les embeddings normalisés.
+
+    Args:
+        embeddings: Matrice normalisée (n_livres, dim)
+        method: 'exact', 'ivf' ou 'hnsw'
+        **params: Paramètres spécifiques à l'index (n_lists, n_probe, M, ef_search...)
+
+    Returns:
+        Index prêt pour search(). Repli sur ExactIndex si hnswlib est absent.
+    """
+    if method not in INDEX_TYPES:
+        raise ValueError(f"Méthode d'index inconnue : {method}")
+    if method == 'hnsw' and hnswlib is None:
+        logger.warning("[ANN] hnswlib non installé - Repli sur la recherche exacte")
+        method = 'exact'
+
+    index = INDEX_TYPES[method](embeddings, **params)
+    if method != 'exact':
+        logger.info("[ANN] Construction de l'index %s (%d livres)...", method, len(embeddings))
+        index.build()
+    return index
+
+
+def load_index(path, embeddings, source=None):
+    """
+    Recharge un index sauvegardé par save() et le rattache aux embeddings.
+
+    Args:
+        path: Fichier .npz de l'index
+        embeddings: Matrice normalisée utilisée lors de la construction
+        source: Empreinte attendue des vecteurs (source_fingerprint), non vérifiée si None
+
+    Returns:
+        Index prêt pour search()
+    """
+    with np.load(npz_path(path)) as arrays:
+        meta = json.loads(str(arrays['meta']))
+        method = meta.pop('method')
+        saved_source = meta.pop('source', None)
+        if meta.pop('n_rows') != len(embeddings):
+            raise ValueError(f"Index {path} construit pour un autre catalogue")
+        if source is not None and saved_source != source:
+            raise ValueError(f"Index {path} construit sur d'autres vecteurs")
+        return INDEX_TYPES[method]._load(path, embeddings, meta, arrays)
+
+
+def load_or_build_index(embeddings, method='exact', path=None, manifest=None, **params):
+    """
+    Recharge l'index depuis path s'il correspond aux vecteurs et aux
+    paramètres demandés, sinon le (re)construit et le sauvegarde.
+
+    Args:
+        embeddings: Matrice normalisée (n_livres, dim)
+        method: 'exact', 'ivf' ou 'hnsw'
+        path: Fichier .npz de l'index (optionnel, aucune persistance si None ;
+              l'extension .npz est ajoutée si absente)
+        manifest: Manifeste du store des embeddings (text_hash, modèle) ;
+                  sans manifeste, les vecteurs sont hachés
+        **params: Paramètres spécifiques à l'index
+
+    Returns:
+        Index prêt pour search()
+    """
+    source = None
+    if path and method != 'exact':
+        path = npz_path(path)
+        source = source_fingerprint(embeddings, manifest)
+        if os.path.exists(path):
+            try:
+                index = load_index(path, embeddings, source)
+                requested = INDEX_TYPES[method](embeddings, **params)
+                if index.method != method:
+                    logger.info("[ANN] Index %s ignoré : méthode %s au lieu de %s", path, index.method, method)
+                elif index.build_params() != requested.build_params():
+                    logger.info("[ANN] Index %s ignoré : paramètres de construction modifiés", path)
+                else:
+                    # Paramètres de requête (n_probe, ef_search) : ceux demandés
+                    for key in index.query_params:
+                        setattr(index, key, getattr(requested, key))
+                    logger.info("[ANN] Index %s chargé depuis %s", method, path)
+                    return index
+            except (OSError, ValueError, ImportError, KeyError) as e:
+                logger.info("[ANN] %s : reconstruction", e)
+
+    index = build_index(embeddings, method, **params)
+    if path and index.method != 'exact':
+        index.save(path, source)
+        logger.info("[ANN] Index sauvegardé dans %s", path)
+    return index
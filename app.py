@@ -4,71 +4,151 @@ Interface Web - Système de Recommandation Littéraire
 Flask App - Questionnaire + Résultats
 """
 
-from flask import Flask, render_template, request, jsonify
-import pandas as pd
-import numpy as np
-import pickle
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 import os
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from data_cleaning import load_catalogue
+from scoring import scoring_matrix, weighted_scores
+from ann_index import load_or_build_index
+from metadata_filter import MetadataIndex, parse_filters
+from encoder_backend import load_encoder
+from embedding_store import MODEL_NAME, load_or_build_store, read_manifest
+from query_composer import LIKERT_DESCRIPTORS, load_composer
+from query_cache import QUERY_CACHE
+from batching import MicroBatchEncoder
+from genai_cache import GENAI_CACHE
+from genai_client import GEMINI_CLIENT, GEMINI_MODEL, SUMMARY_DEADLINE
+from history_store import PREFERENCES_LOG, RESULTS_LOG, HistoryWriter
+from batch_recommend import read_profiles, recommend_batch
+from metrics import REGISTRY, configure_logging, timed
+from profiling import PROFILE_HEADER, RequestProfiler
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 # Variables globales
 model = None
 embeddings = None
+book_index = None
+query_encoder = None
+composer = None
+metadata = None
 df = None
 
+# Synthèses GenAI en arrière-plan, indexées par identifiant de requête
+MAX_SUMMARY_JOBS = 1000
+SSE_KEEPALIVE = 15
+summary_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("GENAI_WORKERS", "4")), thread_name_prefix="genai"
+)
+summary_jobs = OrderedDict()
+summary_jobs_lock = threading.Lock()
+
+# Nombre maximal de profils par appel à /recommend/batch
+BATCH_MAX_PROFILES = int(os.getenv("BATCH_MAX_PROFILES", "10000"))
+
+# Historique append-only (exporter en JSON : python history_store.py export)
+history_writer = HistoryWriter(
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+)
+
+# Métriques HTTP (exportées sur /metrics avec les durées des étapes)
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Requêtes HTTP traitées", labels=('endpoint', 'status')
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", labels=('endpoint',)
+)
+
+
+def collect_runtime_metrics():
+    """Compteurs des caches, du client GenAI, de l'historique et de la file d'encodage"""
+    query_cache = QUERY_CACHE.stats()
+    genai_cache = GENAI_CACHE.stats()
+    genai_client = GEMINI_CLIENT.stats()
+    history = history_writer.stats()
+    return [
+        ("query_cache_hits_total", 'counter', "Requêtes servies par le cache d'embeddings", query_cache['hits']),
+        ("query_cache_misses_total", 'counter', "Requêtes encodées (absentes du cache)", query_cache['misses']),
+        ("query_cache_size", 'gauge', "Entrées du cache d'embeddings", query_cache['size']),
+        ("genai_cache_hits_total", 'counter', "Réponses GenAI servies par le cache", genai_cache['hits']),
+        ("genai_cache_misses_total", 'counter', "Réponses GenAI absentes du cache", genai_cache['misses']),
+        ("genai_cache_stale_hits_total", 'counter', "Réponses GenAI périmées servies en secours", genai_cache['stale_hits']),
+        ("genai_calls_total", 'counter', "Appels à l'API Gemini", genai_client['calls']),
+        ("genai_errors_total", 'counter', "Appels Gemini en échec", genai_client['errors']),
+        ("genai_retries_total", 'counter', "Nouvelles tentatives Gemini", genai_client['retries']),
+        ("genai_skipped_total", 'counter', "Appels Gemini évités (circuit ouvert)", genai_client['skipped']),
+        ("history_queued", 'gauge', "Événements d'historique en attente d'écriture", history['queued']),
+        ("history_written_total", 'counter', "Événements d'historique écrits", history['written']),
+        ("history_errors_total", 'counter', "Erreurs d'écriture de l'historique", history['errors']),
+        ("query_encoder_queue_depth", 'gauge', "Requêtes en attente d'encodage",
+         query_encoder.stats()['queue_depth'] if query_encoder else None),
+    ]
+
+
+REGISTRY.register_collector(collect_runtime_metrics)
+
+# Profilage à la demande de /recommend (PROFILE_SAMPLE_RATE, en-tête X-Profile)
+profiler = RequestProfiler()
+
 def init_system():
     """Initialise le système au démarrage"""
-    global model, embeddings, df
+    global model, embeddings, book_index, query_encoder, composer, metadata, df
     
-    print("[INIT] Chargement du système...")
+    logger.info("[INIT] Chargement du système...")
     
-    # Charger le dataset
-    df = pd.read_csv("Book_Dataset_1.csv", sep=',', encoding='latin1')
-    df = df.drop_duplicates()
-    df = df[
-        (df['Category'].str.strip() != '') &
-        (df['Category'].str.lower() != 'default') &
-        (df['Category'].str.lower() != 'add a comment')
-    ]
-    df = df.dropna(subset=['Title'])
-    
-    def clean_text(text):
-        return str(text).strip().lower() if pd.notna(text) else ""
+    # Charger le dataset nettoyé (snapshot partagé entre workers)
+    df = load_catalogue("Book_Dataset_1.csv")
     
-    df['title_clean'] = df['Title'].apply(clean_text)
-    df['desc_clean'] = df['Book_Description'].apply(clean_text)
-    df['genre_clean'] = df['Category'].apply(clean_text)
-    df['text_full'] = (
-        df['title_clean'] + ". " +
-        df['genre_clean'] + ". " +
-        df['desc_clean']
-    )
+    # Filtres de métadonnées (catégories, prix, étoiles, disponibilité)
+    metadata = MetadataIndex.from_catalogue(df)
     
-    # Charger SBERT
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+    # SBERT chargé en arrière-plan (inutile au démarrage si le store est à jour)
+    # ENCODER_BACKEND = torch | onnx | onnx-int8
+    model = load_encoder(MODEL_NAME).preload()
     
-    # Charger embeddings
-    if os.path.exists("embeddings_books.pkl"):
-        with open("embeddings_books.pkl", 'rb') as f:
-            embeddings = pickle.load(f)
-        embeddings = np.array(embeddings)
-    else:
-        print("[INIT] Génération des embeddings (première fois)...")
-        embeddings = model.encode(
-            df['text_full'].tolist(),
+    def encode(texts):
+        return model.encode(
+            texts,
             convert_to_tensor=False,
             show_progress_bar=True,
             batch_size=32
         )
-        with open("embeddings_books.pkl", 'wb') as f:
-            pickle.dump(embeddings, f)
-        embeddings = np.array(embeddings)
     
-    print(f"[OK] Système initialisé - {len(df)} livres prêts")
+    # Charger les embeddings (store mappé en mémoire, partagé entre workers ;
+    # un store float16 est converti une fois en float32 pour le scoring)
+    embeddings = scoring_matrix(load_or_build_store(
+        df['text_full'].tolist(), encode,
+        model_name=MODEL_NAME,
+        dtype=os.getenv("EMBEDDING_DTYPE", "float32")
+    ))
+    
+    # Index de recherche (BOOK_INDEX = exact | ivf | hnsw)
+    book_index = load_or_build_index(
+        embeddings,
+        method=os.getenv("BOOK_INDEX", "exact"),
+        path=os.getenv("BOOK_INDEX_PATH"),
+        manifest=read_manifest()
+    )
+    
+    # Encodage des requêtes par micro-lots (requêtes concurrentes)
+    query_encoder = MicroBatchEncoder(
+        lambda texts: model.encode(texts, convert_to_tensor=False, batch_size=len(texts)),
+        max_batch_size=int(os.getenv("ENCODE_MAX_BATCH", "32")),
+        max_wait_ms=float(os.getenv("ENCODE_MAX_WAIT_MS", "5"))
+    ).start()
+    
+    # Requêtes composées (QUERY_COMPOSE = string | combinations | descriptors)
+    composer = load_composer(model)
+    
+    logger.info("[OK] Système initialisé - %d livres prêts", len(df))
 
 
 def build_query_from_preferences(preferences):
@@ -81,14 +161,7 @@ def build_query_from_preferences(preferences):
     if preferences.get('favorite_books'):
         parts.append(f"Livres similaires à : {preferences['favorite_books']}")
     
-    intensities = {
-        'intensity_action': ['calme', 'paisible', 'modéré', 'intense', 'très intense'],
-        'intensity_romance': ['sans romance', 'romance légère', 'romance présente', 'romance importante', 'histoire d\'amour centrale'],
-        'intensity_learning': ['divertissement pur', 'un peu éducatif', 'instructif', 'très éducatif', 'essai pédagogique'],
-        'complexity': ['très simple', 'accessible', 'standard', 'complexe', 'très complexe']
-    }
-    
-    for key, descriptors in intensities.items():
+    for key, descriptors in LIKERT_DESCRIPTORS.items():
         score = preferences.get(key, 3)
         parts.append(descriptors[score - 1])
     
@@ -96,21 +169,6 @@ def build_query_from_preferences(preferences):
     return query
 
 
-def calculate_weighted_similarity(query_emb, book_emb, likert_scores):
-    """Calcule le score pondéré"""
-    base_similarity = cosine_similarity(query_emb.reshape(1, -1), book_emb.reshape(1, -1))[0][0]
-    
-    avg_intensity = np.mean([
-        likert_scores.get('intensity_action', 3),
-        likert_scores.get('intensity_romance', 3),
-        likert_scores.get('intensity_learning', 3),
-        likert_scores.get('complexity', 3)
-    ]) / 5.0
-    
-    weighted_score = 0.8 * base_similarity + 0.2 * avg_intensity
-    return weighted_score
-
-
 def generate_genai_summary(preferences, recommendations, query_text):
     """Génère la synthèse avec Gemini"""
     api_key = os.getenv("GEMINI_API_KEY")
@@ -118,9 +176,8 @@ def generate_genai_summary(preferences, recommendations, query_text):
     if not api_key:
         return "[GenAI désactivé - Clé API non configurée. Définissez GEMINI_API_KEY dans les variables d'environnement]"
     
+    cache_key = None
     try:
-        import requests
-        
         top_book = recommendations[0]
         
         prompt = f"""Tu es un conseiller littéraire. Analyse ce profil et recommande le livre.
@@ -137,32 +194,87 @@ TÂCHE (120 mots max) :
 
 Réponse concise et directe."""
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "maxOutputTokens": 512,
-                "temperature": 0.7,
-                "topP": 0.9
-            }
+        generation_config = {
+            "maxOutputTokens": 512,
+            "temperature": 0.7,
+            "topP": 0.9
         }
         
-        response = requests.post(url, json=payload, timeout=30)
-        data = response.json()
+        # Synthèse déjà en cache pour ce (profil, livre)
+        cache_key = GENAI_CACHE.make_key(prompt, GEMINI_MODEL, generation_config)
+        cached = GENAI_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        data = GEMINI_CLIENT.generate(prompt, generation_config, api_key, deadline=SUMMARY_DEADLINE)
         
         if 'error' in data:
-            return f"[Erreur API : {data['error'].get('message', 'Erreur inconnue')}]"
+            return GENAI_CACHE.get_stale(cache_key) or f"[Erreur API : {data['error'].get('message', 'Erreur inconnue')}]"
         
         if 'candidates' in data and data['candidates']:
             candidate = data["candidates"][0]
             parts = candidate["content"]["parts"]
             summary = "".join(part.get("text", "") for part in parts if "text" in part).strip()
+            if summary:
+                GENAI_CACHE.put(cache_key, summary)
             return summary
         
-        return "[Erreur : Réponse API invalide]"
+        return GENAI_CACHE.get_stale(cache_key) or "[Erreur : Réponse API invalide]"
         
     except Exception as e:
-        return f"[Erreur GenAI : {str(e)}]"
+        return GENAI_CACHE.get_stale(cache_key) or f"[Erreur GenAI : {str(e)}]"
+
+
+def save_history(preferences, recommendations, summary, query_text):
+    """Ajoute la session aux historiques JSONL (append-only, écriture en arrière-plan)"""
+    history_writer.append(PREFERENCES_LOG, preferences)
+    history_writer.append(RESULTS_LOG, {
+        'preferences': preferences,
+        'recommendations': recommendations,
+        'summary': summary,
+        'query_text': query_text,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def _summary_task(preferences, recommendations, query_text):
+    """Génère la synthèse puis enregistre la session complète"""
+    summary = generate_genai_summary(preferences, recommendations, query_text)
+    save_history(preferences, recommendations, summary, query_text)
+    return summary
+
+
+def submit_summary(preferences, recommendations, query_text):
+    """
+    Lance la synthèse GenAI sur le pool de threads.
+    Retourne l'identifiant de requête à utiliser avec /summary/<request_id>
+    """
+    request_id = uuid.uuid4().hex
+    future = summary_executor.submit(_summary_task, preferences, recommendations, query_text)
+    with summary_jobs_lock:
+        summary_jobs[request_id] = future
+        while len(summary_jobs) > MAX_SUMMARY_JOBS:
+            summary_jobs.popitem(last=False)
+    return request_id
+
+
+def get_summary_job(request_id):
+    with summary_jobs_lock:
+        return summary_jobs.get(request_id)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if 'request_start' in g:
+        HTTP_DURATION.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
 
 
 @app.route('/')
@@ -171,9 +283,69 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/stats')
+def stats():
+    """Compteurs des caches et de la file d'encodage des requêtes"""
+    return jsonify({
+        'query_cache': QUERY_CACHE.stats(),
+        'genai_cache': GENAI_CACHE.stats(),
+        'genai_client': GEMINI_CLIENT.stats(),
+        'history': history_writer.stats(),
+        'query_encoder': query_encoder.stats() if query_encoder else None,
+        'query_composer': composer.stats() if composer else None,
+        'profiler': profiler.stats()
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """Métriques au format texte Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/summary/<request_id>')
+def summary(request_id):
+    """Synthèse GenAI d'une requête : prête ou encore en cours"""
+    future = get_summary_job(request_id)
+    if future is None:
+        return jsonify({'success': False, 'error': 'Requête inconnue'}), 404
+    if not future.done():
+        return jsonify({'success': True, 'ready': False})
+    return jsonify({'success': True, 'ready': True, 'summary': future.result()})
+
+
+@app.route('/summary/<request_id>/stream')
+def summary_stream(request_id):
+    """Synthèse GenAI d'une requête en Server-Sent Events"""
+    future = get_summary_job(request_id)
+    if future is None:
+        return jsonify({'success': False, 'error': 'Requête inconnue'}), 404
+    
+    def events():
+        while True:
+            try:
+                summary = future.result(timeout=SSE_KEEPALIVE)
+                break
+            except FutureTimeout:
+                yield ": keep-alive\n\n"
+        yield f"event: summary\ndata: {json.dumps({'summary': summary}, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
 @app.route('/recommend', methods=['POST'])
+@profiler.profiled('recommend', lambda: request.headers.get(PROFILE_HEADER))
 def recommend():
     """Traite le questionnaire et retourne les recommandations"""
+    import pandas as pd
+    
+    # Filtres numériques (prix maximal, note minimale) : 400 si non numériques
+    try:
+        filters = parse_filters(request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     try:
         # Récupérer les données du formulaire
         preferences = {
@@ -184,98 +356,86 @@ def recommend():
             'intensity_romance': int(request.form.get('intensity_romance', 3)),
             'intensity_learning': int(request.form.get('intensity_learning', 3)),
             'complexity': int(request.form.get('complexity', 3)),
+            'max_price': filters['max_price'],
+            'min_stars': filters['min_stars'],
             'timestamp': datetime.now().isoformat()
         }
         
         # Construire la requête
-        query_text = build_query_from_preferences(preferences)
-        
-        # Encoder la requête
-        query_emb = model.encode(query_text, convert_to_tensor=False)
+        with timed('build_query'):
+            query_text = build_query_from_preferences(preferences)
         
-        # Calculer les scores
-        scores = []
-        for i in range(len(df)):
-            book_emb = embeddings[i]
-            score = calculate_weighted_similarity(query_emb, book_emb, preferences)
-            scores.append(score)
+        with timed('encode'):
+            if composer is not None:
+                # Descripteurs précalculés + texte libre (pas d'encodage sans texte libre)
+                query_emb = composer.compose(preferences, encode=query_encoder.encode)
+            else:
+                # Encoder la requête (cache LRU partagé, puis micro-lots)
+                query_emb = QUERY_CACHE.get_or_encode(query_text, query_encoder.encode, MODEL_NAME)
         
-        scores = np.array(scores)
-        
-        # Top 3
-        top_indices = np.argsort(-scores)[:3]
+        # Top 3 via l'index (livres exclus filtrés avant la recherche),
+        # pondération appliquée aux candidats
+        top_indices, similarities = book_index.search(query_emb, 3, exclude=metadata.mask_for(preferences))
+        top_scores = weighted_scores(similarities, preferences)
         
         recommendations = []
-        for rank, idx in enumerate(top_indices, 1):
+        for rank, (idx, score) in enumerate(zip(top_indices, top_scores), 1):
             rec = {
                 'rank': rank,
                 'title': df.iloc[idx]['Title'],
                 'genre': df.iloc[idx]['Category'],
                 'description': df.iloc[idx]['Book_Description'] if pd.notna(df.iloc[idx]['Book_Description']) else "Description non disponible",
-                'similarity_score': float(scores[idx]),
-                'percentage': float(scores[idx] * 100)
+                'similarity_score': float(score),
+                'percentage': float(score * 100)
             }
             recommendations.append(rec)
         
-        # Générer la synthèse GenAI
-        summary = generate_genai_summary(preferences, recommendations, query_text)
-        
-        # Sauvegarder les préférences utilisateur (historique)
-        import json
-        preferences_history = []
-        if os.path.exists('user_preferences.json'):
-            try:
-                with open('user_preferences.json', 'r', encoding='utf-8') as f:
-                    preferences_history = json.load(f)
-                    if not isinstance(preferences_history, list):
-                        preferences_history = [preferences_history]
-            except:
-                preferences_history = []
-        
-        preferences_history.append(preferences)
-        
-        with open('user_preferences.json', 'w', encoding='utf-8') as f:
-            json.dump(preferences_history, f, indent=2, ensure_ascii=False)
-        
-        # Sauvegarder les résultats complets (historique)
-        results_history = []
-        if os.path.exists('recommendation_results.json'):
-            try:
-                with open('recommendation_results.json', 'r', encoding='utf-8') as f:
-                    results_history = json.load(f)
-                    if not isinstance(results_history, list):
-                        results_history = [results_history]
-            except:
-                results_history = []
-        
-        current_result = {
-            'preferences': preferences,
-            'recommendations': recommendations,
-            'summary': summary,
-            'query_text': query_text,
-            'timestamp': datetime.now().isoformat()
-        }
-        results_history.append(current_result)
-        
-        with open('recommendation_results.json', 'w', encoding='utf-8') as f:
-            json.dump(results_history, f, indent=2, ensure_ascii=False)
-        
-        print(f"[OK] Fichiers JSON sauvegardés (session #{len(results_history)}) - {datetime.now().strftime('%H:%M:%S')}")
+        # Synthèse GenAI en arrière-plan (récupérée via /summary/<request_id>)
+        request_id = submit_summary(preferences, recommendations, query_text)
         
         return jsonify({
             'success': True,
             'recommendations': recommendations,
-            'summary': summary,
+            'request_id': request_id,
             'query_text': query_text
         })
         
     except Exception as e:
+        logger.exception("[Erreur] /recommend : %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch_route():
+    """
+    Recommandations par lot : corps JSONL (ou fichier 'profiles'), une ligne
+    de préférences par profil ; réponse JSONL en flux, une ligne par profil
+    """
+    upload = request.files.get('profiles')
+    data = upload.read() if upload else request.get_data()
+    try:
+        profiles = read_profiles(data.decode('utf-8').splitlines())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'JSONL invalide : {e}'}), 400
+    if len(profiles) > BATCH_MAX_PROFILES:
+        return jsonify({
+            'success': False,
+            'error': f'Trop de profils ({len(profiles)} > {BATCH_MAX_PROFILES})'
+        }), 413
+    top_k = request.args.get('top_k', 3, type=int)
+    
+    def lines():
+        for result in recommend_batch(profiles, df, model, embeddings, top_k, metadata=metadata):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+
 if __name__ == '__main__':
+    # LOG_LEVEL=DEBUG pour les messages détaillés
+    configure_logging(fmt="%(asctime)s %(levelname)s %(name)s: %(message)s")
     init_system()
     app.run(debug=True, host='0.0.0.0', port=5000)
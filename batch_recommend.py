@@ -0,0 +1,242 @@
+"""
+Recommandations par lot : des milliers de profils en un seul passage.
+
+Chaque profil (même schéma que les préférences du questionnaire, une ligne
+JSON par profil) est converti en requête par build_query_from_preferences().
+Les requêtes distinctes sont encodées par grands lots, puis scorées par un
+produit matriciel profils x livres découpé en tranches (mémoire bornée) ;
+les Top K sont écrits au fil de l'eau en JSONL.
+
+Les requêtes construites depuis le questionnaire contiennent toujours les
+quatre descripteurs Likert (au moins 5 mots) : l'enrichissement EF4.1 ne
+s'applique jamais, les résultats sont ceux de recommend_books() sans index.
+
+Utilisation :
+    python batch_recommend.py profils.jsonl -o recommandations.jsonl --top-k 3
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from book_recommendation_system import (
+    build_query_from_preferences, load_knowledge_base, load_sbert_and_embeddings
+)
+from encoder_backend import load_encoder
+from embedding_store import MODEL_NAME
+from metadata_filter import MetadataIndex, parse_filters
+from metrics import configure_logging
+from scoring import LIKERT_KEYS, normalize_embeddings, scoring_matrix, top_k_indices, weighted_scores
+
+
+ENCODE_BATCH_SIZE = int(os.getenv("BATCH_ENCODE_SIZE", "256"))
+# Taille maximale d'une tranche de scores profils x livres (float32)
+MAX_CHUNK_BYTES = int(os.getenv("BATCH_CHUNK_MB", "256")) * 1024 * 1024
+
+
+def parse_profiles(entries):
+    """
+    Valide les profils lus (dictionnaires), convertit les scores Likert en
+    entiers et les filtres numériques (max_price, min_stars...) en nombres.
+
+    Args:
+        entries: Itérable de dictionnaires de préférences
+
+    Returns:
+        Liste des profils valides (les entrées non dictionnaires sont ignorées)
+
+    Raises:
+        ValueError: Score Likert ou filtre non numérique (numéro du profil dans le message)
+    """
+    profiles = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            profiles.append(_parse_profile(entry))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Profil {len(profiles)} : {e}") from None
+    return profiles
+
+
+def _parse_profile(entry):
+    profile = dict(entry)
+    for key in LIKERT_KEYS:
+        if key in profile:
+            profile[key] = min(5, max(1, int(profile[key])))
+    profile.update(parse_filters(profile))
+    return profile
+
+
+def read_profiles(lines):
+    """
+    Lit et valide des profils JSONL (un objet JSON par ligne).
+
+    Contrairement à history_store.read_history, aucune ligne n'est ignorée
+    en silence : un profil perdu décalerait les positions 'profile' de la
+    sortie. Seules les lignes vides sont sautées.
+
+    Args:
+        lines: Itérable de lignes (fichier ouvert ou liste de chaînes)
+
+    Returns:
+        Liste des profils (voir parse_profiles), dans l'ordre du fichier
+
+    Raises:
+        ValueError: Ligne invalide (JSON illisible, pas un objet, score ou
+            filtre non numérique), avec son numéro
+    """
+    profiles = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            if not isinstance(entry, dict):
+                raise ValueError("objet JSON attendu")
+            profiles.append(_parse_profile(entry))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Ligne {line_number} : {e}") from None
+    return profiles
+
+
+def encode_queries(model, query_texts, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Encode les requêtes distinctes par grands lots.
+
+    Args:
+        model: Encodeur SBERT (encode() compatible SentenceTransformer)
+        query_texts: Liste des requêtes (doublons fréquents)
+        batch_size: Taille des lots d'encodage
+
+    Returns:
+        (matrice normalisée des requêtes distinctes, indice de ligne par requête)
+    """
+    unique_texts, inverse = np.unique(np.asarray(query_texts, dtype=object), return_inverse=True)
+    matrix = model.encode(
+        unique_texts.tolist(),
+        convert_to_tensor=False,
+        show_progress_bar=len(unique_texts) > batch_size,
+        batch_size=batch_size
+    )
+    return normalize_embeddings(np.asarray(matrix)), inverse
+
+
+def chunk_rows(n_books, max_chunk_bytes=MAX_CHUNK_BYTES):
+    """Nombre de profils par tranche pour que la matrice de scores tienne dans le budget."""
+    return max(1, max_chunk_bytes // (4 * max(1, n_books)))
+
+
+def score_profiles(query_matrix, rows, embeddings, profiles, top_k=3, max_chunk_bytes=MAX_CHUNK_BYTES,
+                   metadata=None):
+    """
+    EF3.1 / EF3.2 pour tous les profils : produit profils x livres par tranches.
+
+    Args:
+        query_matrix: Embeddings normalisés des requêtes distinctes
+        rows: Ligne de query_matrix pour chaque profil
+        embeddings: Embeddings normalisés des livres (n_livres, dim)
+        profiles: Profils (scores Likert), dans l'ordre de rows
+        top_k: Nombre de livres par profil
+        max_chunk_bytes: Taille maximale d'une tranche de scores
+        metadata: MetadataIndex optionnel (filtres 'avoid', 'max_price'... du profil)
+
+    Yields:
+        (indices des top_k livres, scores pondérés) pour chaque profil, dans l'ordre
+    """
+    step = chunk_rows(len(embeddings), max_chunk_bytes)
+    for start in range(0, len(rows), step):
+        chunk = rows[start:start + step]
+        similarities = query_matrix[chunk] @ embeddings.T
+        for offset, profile in enumerate(profiles[start:start + step]):
+            scores = weighted_scores(similarities[offset], profile)
+            exclude = metadata.mask_for(profile) if metadata is not None else None
+            top_indices = top_k_indices(scores, top_k, exclude)
+            yield top_indices, scores[top_indices]
+
+
+def recommend_batch(profiles, df, model, embeddings, top_k=3, batch_size=ENCODE_BATCH_SIZE,
+                    max_chunk_bytes=MAX_CHUNK_BYTES, metadata=None):
+    """
+    Recommandations Top K pour une liste de profils.
+
+    Args:
+        profiles: Profils de préférences (voir parse_profiles)
+        df: Catalogue nettoyé
+        model: Encodeur SBERT
+        embeddings: Embeddings normalisés des livres
+        top_k: Nombre de livres par profil
+        batch_size: Taille des lots d'encodage
+        max_chunk_bytes: Taille maximale d'une tranche de scores
+        metadata: MetadataIndex optionnel (filtres des profils)
+
+    Yields:
+        Un dictionnaire de résultat par profil, dans l'ordre d'entrée
+    """
+    if not profiles:
+        return
+    query_texts = [build_query_from_preferences(profile) for profile in profiles]
+    query_matrix, rows = encode_queries(model, query_texts, batch_size)
+    # Store float16 : converti une fois (le produit matriciel float16 est lent)
+    book_matrix = scoring_matrix(embeddings)
+
+    titles = df['Title'].to_numpy()
+    genres = df['Category'].to_numpy()
+    scored = score_profiles(query_matrix, rows, book_matrix, profiles, top_k, max_chunk_bytes, metadata)
+    for position, (profile, query_text, (top_indices, top_scores)) in enumerate(
+            zip(profiles, query_texts, scored)):
+        yield {
+            'profile': position,
+            'user_id': profile.get('user_id', profile.get('id')),
+            'query_text': query_text,
+            'recommendations': [
+                {
+                    'rank': rank,
+                    'book_index': int(idx),
+                    'title': titles[idx],
+                    'genre': genres[idx],
+                    'similarity_score': float(score)
+                }
+                for rank, (idx, score) in enumerate(zip(top_indices, top_scores), 1)
+            ]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommandations par lot (profils JSONL -> Top K JSONL)")
+    parser.add_argument('profiles', help="Fichier JSONL de préférences (une par ligne)")
+    parser.add_argument('-o', '--output', default="batch_recommendations.jsonl",
+                        help="Fichier JSONL de sortie")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=ENCODE_BATCH_SIZE)
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        with open(args.profiles, 'r', encoding='utf-8') as f:
+            profiles = read_profiles(f)
+    except (OSError, ValueError) as e:
+        parser.error(f"{args.profiles} : {e}")
+    print(f"[Batch] {len(profiles)} profils lus depuis {args.profiles}")
+
+    df = load_knowledge_base()
+    metadata = MetadataIndex.from_catalogue(df)
+    model, embeddings = load_sbert_and_embeddings(
+        df, dtype=os.getenv("EMBEDDING_DTYPE", "float32"), model=load_encoder(MODEL_NAME)
+    )
+
+    start = time.perf_counter()
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for result in recommend_batch(profiles, df, model, embeddings, args.top_k, args.batch_size,
+                                      metadata=metadata):
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"[OK] {count} profils traités en {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
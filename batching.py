@@ -0,0 +1,120 @@
+"""
+Micro-batching des encodages SBERT pour l'application Flask.
+
+Sous trafic concurrent, chaque requête encodait sa requête seule (batch de 1).
+Ici, les requêtes déposent leur texte dans une file et attendent un Future ;
+un thread de fond regroupe jusqu'à max_batch_size textes (ou attend au plus
+max_wait_ms), les encode en un seul appel et redistribue les résultats.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class MicroBatchEncoder:
+    """
+    File d'encodage par micro-lots avec métriques (profondeur de file,
+    taille des lots).
+
+    Args:
+        encode_batch: Fonction liste de textes -> matrice d'embeddings
+        max_batch_size: Nombre maximal de textes par appel au modèle
+        max_wait_ms: Attente maximale pour compléter un lot (millisecondes)
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+
+    def start(self):
+        """Démarre le thread de fond (idempotent)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sbert-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Arrête le thread après avoir traité les textes déjà en file."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, text):
+        """
+        Dépose un texte dans la file.
+
+        Returns:
+            Future résolu avec l'embedding (dim,)
+        """
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        """Encode un texte via la file et attend le résultat."""
+        return self.submit(text).result(timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Arrêt demandé : traiter ce lot puis sortir
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        """Métriques : profondeur de file, nombre et taille des lots."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items()))
+            }
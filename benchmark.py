@@ -0,0 +1,359 @@
+"""
+Benchmarks des étapes du pipeline de recommandation.
+
+Chaque étape est chronométrée séparément (médiane, p95, min sur --repeat
+exécutions après un échauffement) :
+- csv_load_clean     : lecture + nettoyage du CSV (load_and_clean_dataset)
+- catalogue_snapshot : relecture du snapshot du catalogue (load_catalogue)
+- store_open         : ouverture du store d'embeddings (memmap)
+- query_encode       : encodage d'une requête (cache froid), puis via le cache
+- scoring            : score pondéré de tout le catalogue (score_catalogue)
+- top_k              : sélection du Top 3 (top_k_indices)
+- scoring_filtered   : scoring + Top 3 avec un pré-filtre de métadonnées
+- recommend_e2e      : POST /recommend via le client de test Flask, GenAI bouchonné
+
+Catalogues : Book_Dataset_1.csv ('real') et catalogues synthétiques de
+10k / 100k / 1M lignes (vecteurs unitaires aléatoires, métadonnées du
+catalogue réel répétées), générés une fois dans --workdir.
+
+Utilisation :
+    python benchmark.py --json bench.json
+    python benchmark.py --sizes real,10000 --repeat 50 --baseline bench.json --max-regression 1.25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from embedding_store import DEFAULT_STORE_PATH, MODEL_NAME, load_or_build_store, open_store
+from scoring import normalize_embeddings, score_catalogue, scoring_matrix, top_k_indices, top_k_scores
+
+
+DEFAULT_SIZES = ['real', '10000', '100000', '1000000']
+BENCH_PREFERENCES = {
+    'description': "a dark psychological thriller with an unreliable narrator",
+    'favorite_books': "Gone Girl",
+    'avoid': "Romance",
+    'intensity_action': 4,
+    'intensity_romance': 2,
+    'intensity_learning': 2,
+    'complexity': 4
+}
+
+
+def quiet():
+    """Rend muets les print() des modules chronométrés."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def time_call(fn, repeat=20, warmup=1, setup=None):
+    """
+    Chronomètre une fonction.
+
+    Args:
+        fn: Fonction sans argument à chronométrer
+        repeat: Nombre d'exécutions mesurées
+        warmup: Exécutions non mesurées préalables
+        setup: Fonction appelée avant chaque exécution (non chronométrée)
+
+    Returns:
+        Dictionnaire des temps en millisecondes (min, median, mean, p95, repeat)
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'min_ms': round(times[0], 4),
+        'median_ms': round(statistics.median(times), 4),
+        'mean_ms': round(statistics.fmean(times), 4),
+        'p95_ms': round(times[min(len(times) - 1, int(0.95 * len(times)))], 4),
+        'repeat': repeat
+    }
+
+
+def random_unit_vectors(n_rows, dim, seed=0):
+    """Matrice (n_rows, dim) de vecteurs unitaires aléatoires (float32)."""
+    rng = np.random.default_rng(seed)
+    return normalize_embeddings(rng.standard_normal((n_rows, dim), dtype=np.float32))
+
+
+def synthetic_catalogue(df, n_rows):
+    """Catalogue de n_rows lignes : les lignes du catalogue réel répétées."""
+    rows = np.arange(n_rows) % len(df)
+    synthetic = df.iloc[rows].reset_index(drop=True)
+    synthetic['text_full'] = [f"synthetic book {i}" for i in range(n_rows)]
+    return synthetic
+
+
+def synthetic_store(df, dim, workdir, dtype='float32'):
+    """
+    Store d'embeddings synthétique (réutilisé entre deux exécutions).
+
+    Returns:
+        Tuple (matrice de scoring, memmap si float32, chemin du store)
+    """
+    path = os.path.join(workdir, f"store_{len(df)}")
+    counter = [0]
+
+    def encode(texts):
+        counter[0] += 1
+        return random_unit_vectors(len(texts), dim, seed=counter[0])
+
+    with quiet():
+        embeddings = load_or_build_store(
+            df['text_full'].tolist(), encode, path=path, model_name=f"synthetic-{dim}", dtype=dtype
+        )
+    return scoring_matrix(embeddings), path
+
+
+def load_model():
+    """Encodeur SBERT du backend courant, ou None si indisponible."""
+    from encoder_backend import load_encoder
+    try:
+        with quiet():
+            model = load_encoder(MODEL_NAME)
+            model.load()
+        return model
+    except (ImportError, OSError) as e:
+        print(f"[Bench] Encodeur indisponible ({e}) - encodage remplacé par des vecteurs aléatoires")
+        return None
+
+
+class StubEncoder:
+    """Encodeur de repli (vecteurs aléatoires déterministes) si SBERT est absent."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.stack([
+            random_unit_vectors(1, self.dim, seed=abs(hash(t)) % 2 ** 32)[0]
+            for t in ([texts] if single else texts)
+        ])
+        return vectors[0] if single else vectors
+
+
+def bench_app(df, embeddings, metadata, model, workdir, repeat):
+    """POST /recommend de bout en bout (client de test Flask, GenAI bouchonné)."""
+    import app
+    from ann_index import ExactIndex
+    from batching import MicroBatchEncoder
+    from query_cache import QUERY_CACHE
+
+    app.df, app.embeddings, app.metadata, app.model = df, embeddings, metadata, model
+    app.book_index = ExactIndex(embeddings)
+    app.composer = None
+    app.query_encoder = MicroBatchEncoder(
+        lambda texts: model.encode(texts, convert_to_tensor=False, batch_size=len(texts))
+    ).start()
+    # GenAI bouchonné, historique écrit dans le répertoire de travail
+    app.generate_genai_summary = lambda preferences, recommendations, query_text: "stub"
+    app.PREFERENCES_LOG = os.path.join(workdir, "bench_preferences.jsonl")
+    app.RESULTS_LOG = os.path.join(workdir, "bench_results.jsonl")
+
+    client = app.app.test_client()
+    form = {key: str(value) for key, value in BENCH_PREFERENCES.items()}
+
+    def post():
+        response = client.post('/recommend', data=form)
+        if response.status_code != 200:
+            raise RuntimeError(f"/recommend a échoué : {response.get_data(as_text=True)[:200]}")
+
+    try:
+        return time_call(post, repeat, setup=QUERY_CACHE.clear)
+    finally:
+        app.query_encoder.stop()
+
+
+def run_catalogue(label, df, embeddings, metadata, model, query_emb, args):
+    """Étapes dépendant de la taille du catalogue."""
+    results = {}
+    scores = score_catalogue(query_emb, embeddings, BENCH_PREFERENCES)
+    exclude = metadata.mask_for(BENCH_PREFERENCES)
+
+    results['scoring'] = time_call(lambda: score_catalogue(query_emb, embeddings, BENCH_PREFERENCES), args.repeat)
+    results['top_k'] = time_call(lambda: top_k_indices(scores, 3), args.repeat)
+    results['scoring_filtered'] = time_call(
+        lambda: top_k_scores(query_emb, embeddings, BENCH_PREFERENCES, 3, exclude), args.repeat
+    )
+    with quiet():
+        results['recommend_e2e'] = bench_app(df, embeddings, metadata, model, args.workdir, args.repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_baseline(results, baseline_path, max_regression, min_ms=1.0):
+    """
+    Compare les médianes à un rapport JSON précédent.
+
+    Les étapes sous min_ms (bruit de mesure) sont affichées sans être
+    signalées comme régressions.
+
+    Returns:
+        Liste des régressions (catalogue, étape, ratio) au-delà de max_regression
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['catalogue'], r['stage']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\n[Bench] Comparaison avec {baseline_path} (médianes)")
+    for result in results:
+        previous = baseline.get((result['catalogue'], result['stage']))
+        if not previous or not previous['median_ms']:
+            continue
+        ratio = result['median_ms'] / previous['median_ms']
+        regressed = max_regression and ratio > max_regression and result['median_ms'] >= min_ms
+        flag = "  [RÉGRESSION]" if regressed else ""
+        print(f"   {result['catalogue']:>8} {result['stage']:20} x{ratio:5.2f}{flag}")
+        if flag:
+            regressions.append((result['catalogue'], result['stage'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline de recommandation")
+    parser.add_argument('--sizes', default=",".join(DEFAULT_SIZES),
+                        help="Catalogues : 'real' et/ou nombres de lignes synthétiques")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--dim', type=int, default=384, help="Dimension des vecteurs synthétiques")
+    parser.add_argument('--dtype', default=os.getenv("EMBEDDING_DTYPE", "float32"))
+    parser.add_argument('--workdir', default="bench_data", help="Stores synthétiques et historiques")
+    parser.add_argument('--json', dest='json_path', default=None, help="Écrit les résultats en JSON")
+    parser.add_argument('--baseline', default=None, help="Rapport JSON de référence")
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help="Ratio de médiane toléré ; code de sortie 1 au-delà")
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help="Médiane en dessous de laquelle une régression est ignorée")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    from data_cleaning import load_and_clean_dataset, load_catalogue
+    from metadata_filter import MetadataIndex
+
+    results = []
+
+    def record(catalogue, stage, n_rows, timing):
+        results.append({'catalogue': catalogue, 'stage': stage, 'n_rows': n_rows, **timing})
+        print(f"   {catalogue:>8} {stage:20} médiane {timing['median_ms']:10.3f} ms   "
+              f"p95 {timing['p95_ms']:10.3f} ms")
+
+    print("=" * 80)
+    print("  BENCHMARKS DU PIPELINE")
+    print("=" * 80)
+
+    with quiet():
+        df_real = load_catalogue("Book_Dataset_1.csv")
+    model = load_model()
+    encoder_name = MODEL_NAME if model is not None else "stub"
+    if model is None:
+        model = StubEncoder(args.dim)
+
+    # Étapes indépendantes de la taille du catalogue
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        snapshot_path = os.path.join(snapshot_dir, "snapshot")
+        with quiet():
+            clean_timing = time_call(lambda: load_and_clean_dataset("Book_Dataset_1.csv"), max(3, args.repeat // 4))
+            load_catalogue("Book_Dataset_1.csv", snapshot_path=snapshot_path)
+            snapshot_timing = time_call(
+                lambda: load_catalogue("Book_Dataset_1.csv", snapshot_path=snapshot_path), args.repeat
+            )
+        record('real', 'csv_load_clean', len(df_real), clean_timing)
+        record('real', 'catalogue_snapshot', len(df_real), snapshot_timing)
+
+    counter = [0]
+
+    def cold_query():
+        counter[0] += 1
+        model.encode(f"{BENCH_PREFERENCES['description']} {counter[0]}", convert_to_tensor=False)
+
+    record('query', 'query_encode', 1, time_call(cold_query, args.repeat))
+    query_text = BENCH_PREFERENCES['description']
+    from query_cache import QUERY_CACHE
+    encode = lambda text: model.encode(text, convert_to_tensor=False)
+    record('query', 'query_encode_cached', 1,
+           time_call(lambda: QUERY_CACHE.get_or_encode(query_text, encode, encoder_name), args.repeat))
+
+    for size in [s.strip() for s in args.sizes.split(',') if s.strip()]:
+        if size == 'real':
+            df = df_real
+            from book_recommendation_system import load_sbert_and_embeddings
+            if encoder_name == "stub":
+                embeddings, store_path = synthetic_store(df, args.dim, args.workdir, args.dtype)
+            else:
+                with quiet():
+                    _, embeddings = load_sbert_and_embeddings(df, dtype=args.dtype, model=model)
+                store_path = DEFAULT_STORE_PATH
+        else:
+            print(f"\n[Bench] Catalogue synthétique de {int(size)} lignes...")
+            df = synthetic_catalogue(df_real, int(size))
+            embeddings, store_path = synthetic_store(df, args.dim, args.workdir, args.dtype)
+
+        with quiet():
+            metadata = MetadataIndex.from_catalogue(df)
+        record(size, 'store_open', len(df), time_call(lambda: open_store(store_path), args.repeat))
+
+        query_emb = model.encode(query_text, convert_to_tensor=False)
+        if len(query_emb) != embeddings.shape[1]:
+            # Catalogue synthétique d'une autre dimension que le modèle
+            query_emb = random_unit_vectors(1, embeddings.shape[1])[0]
+            bench_model = StubEncoder(embeddings.shape[1])
+        else:
+            bench_model = model
+        for stage, timing in run_catalogue(size, df, embeddings, metadata, bench_model, query_emb, args).items():
+            record(size, stage, len(df), timing)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'encoder': encoder_name,
+            'encoder_backend': os.getenv("ENCODER_BACKEND", "torch"),
+            'dtype': args.dtype,
+            'dim': args.dim
+        },
+        'results': results
+    }
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] Résultats sauvegardés dans {args.json_path}")
+
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.max_regression, args.min_ms)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,13 +13,23 @@
 
 import sys
 import os
-import pandas as pd
-import numpy as np
-import pickle
 import json
+import logging
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from data_cleaning import load_catalogue
+from scoring import scoring_matrix, top_k_scores, weighted_scores
+from ann_index import load_or_build_index
+from metadata_filter import MetadataIndex
+from encoder_backend import load_encoder
+from embedding_store import DEFAULT_STORE_PATH, MODEL_NAME, load_or_build_store, read_manifest
+from query_composer import LIKERT_DESCRIPTORS, load_composer
+from query_cache import encode_query
+from genai_cache import GENAI_CACHE
+from genai_client import ENRICH_DEADLINE, GEMINI_CLIENT, GEMINI_MODEL, SUMMARY_DEADLINE, GenAIError
+from metrics import configure_logging, timed
+
+logger = logging.getLogger(__name__)
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -116,68 +126,44 @@ def save_preferences(preferences, filepath="user_preferences.json"):
 def load_knowledge_base(path="Book_Dataset_1.csv"):
     """
     EF2.1 : Référentiel de connaissances (livres)
-    Charge et nettoie le dataset de livres
+    Charge le dataset nettoyé (snapshot partagé, voir data_cleaning.py)
     """
     print("\n[EF2.1] Chargement du référentiel de connaissances...")
     
-    df = pd.read_csv(path, sep=',', encoding='latin1')
-    df = df.drop_duplicates()
-    
-    # Nettoyage
-    df = df[
-        (df['Category'].str.strip() != '') &
-        (df['Category'].str.lower() != 'default') &
-        (df['Category'].str.lower() != 'add a comment')
-    ]
-    
-    df = df.dropna(subset=['Title'])
-    
-    def clean_text(text):
-        return str(text).strip().lower() if pd.notna(text) else ""
-    
-    df['title_clean'] = df['Title'].apply(clean_text)
-    df['desc_clean'] = df['Book_Description'].apply(clean_text)
-    df['genre_clean'] = df['Category'].apply(clean_text)
-    
-    # EF2.1 : Texte complet pour embeddings
-    df['text_full'] = (
-        df['title_clean'] + ". " +
-        df['genre_clean'] + ". " +
-        df['desc_clean']
-    )
+    # EF2.1 : Nettoyage et texte complet pour embeddings (text_full)
+    df = load_catalogue(path)
     
     print(f"[OK] {len(df)} livres dans le référentiel")
     
     return df
 
 
-def load_sbert_and_embeddings(df, embedding_path="embeddings_books.pkl"):
+def load_sbert_and_embeddings(df, store_path=DEFAULT_STORE_PATH, dtype="float32", model=None):
     """
     EF2.2 : Modélisation Sémantique avec SBERT (Open-Source, Local)
-    Génère ou charge les embeddings des livres
+    Génère ou charge les embeddings des livres (store mappé en mémoire,
+    reconstruit si le texte du catalogue ou le modèle a changé)
+    Le modèle n'est chargé qu'au premier encodage (store à jour = pas de chargement)
     """
     print("\n[EF2.2] Modélisation sémantique (SBERT)...")
     
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+    if model is None:
+        model = load_encoder(MODEL_NAME)
     
-    if os.path.exists(embedding_path):
-        print("[OK] Chargement des embeddings depuis le cache...")
-        with open(embedding_path, 'rb') as f:
-            embeddings = pickle.load(f)
-    else:
-        print("[OK] Génération des embeddings (première fois)...")
-        embeddings = model.encode(
-            df['text_full'].tolist(),
+    def encode(texts):
+        return model.encode(
+            texts,
             convert_to_tensor=False,
             show_progress_bar=True,
             batch_size=32
         )
-        
-        with open(embedding_path, 'wb') as f:
-            pickle.dump(embeddings, f)
-        print(f"[OK] Embeddings sauvegardés dans {embedding_path}")
     
-    embeddings = np.array(embeddings)
+    # Embeddings déjà normalisés dans le store (produit scalaire = cosinus),
+    # store float16 converti une fois en float32 pour le scoring
+    embeddings = scoring_matrix(load_or_build_store(
+        df['text_full'].tolist(), encode,
+        path=store_path, model_name=MODEL_NAME, dtype=dtype
+    ))
     print(f"[OK] Embeddings shape: {embeddings.shape}")
     
     return model, embeddings
@@ -196,57 +182,59 @@ def enrich_short_query(text, use_genai=False, api_key=None):
     
     # Condition : seulement si texte court
     if word_count >= 5:
-        print(f"[EF4.1] Texte suffisamment long ({word_count} mots) - Pas d'enrichissement")
+        logger.info("[EF4.1] Texte suffisamment long (%d mots) - Pas d'enrichissement", word_count)
         return text
     
-    print(f"[EF4.1] Texte court ({word_count} mots) - Enrichissement nécessaire")
+    logger.info("[EF4.1] Texte court (%d mots) - Enrichissement nécessaire", word_count)
     
     if not use_genai or not api_key:
         # Fallback sans GenAI
-        print("[EF4.1] Mode sans GenAI - Enrichissement basique")
+        logger.info("[EF4.1] Mode sans GenAI - Enrichissement basique")
         return f"{text}. Recherche de livre avec ambiance immersive et intrigue captivante."
     
     # Appel GenAI (Google Gemini)
+    cache_key = None
     try:
-        import requests
-        
         prompt = f"""Enrichis cette description de livre recherché en ajoutant du contexte littéraire :
 "{text}"
 
 Génère UNE phrase enrichie (max 30 mots) qui développe les thèmes, l'ambiance et le style narratif recherché."""
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "maxOutputTokens": 150,
-                "temperature": 0.8
-            }
+        generation_config = {
+            "maxOutputTokens": 150,
+            "temperature": 0.8
         }
         
-        response = requests.post(url, json=payload, timeout=10)
-        data = response.json()
+        # Réponse déjà en cache pour ce prompt
+        cache_key = GENAI_CACHE.make_key(prompt, GEMINI_MODEL, generation_config)
+        cached = GENAI_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info("[EF4.1] Enrichissement GenAI (cache) : %s", cached)
+            return cached
+        
+        data = GEMINI_CLIENT.generate(prompt, generation_config, api_key, deadline=ENRICH_DEADLINE)
         
         # Vérifier les erreurs API
         if 'error' in data:
             error_msg = data['error'].get('message', 'Erreur inconnue')
-            print(f"[Erreur API Gemini] {error_msg}")
-            return f"{text}. Recherche de livre avec ambiance immersive et intrigue captivante."
+            logger.error("[Erreur API Gemini] %s", error_msg)
+            return GENAI_CACHE.get_stale(cache_key) or f"{text}. Recherche de livre avec ambiance immersive et intrigue captivante."
         
         if 'candidates' not in data or not data['candidates']:
-            print(f"[Erreur] Réponse API invalide")
-            return f"{text}. Recherche de livre avec ambiance immersive et intrigue captivante."
+            logger.error("[Erreur] Réponse API invalide")
+            return GENAI_CACHE.get_stale(cache_key) or f"{text}. Recherche de livre avec ambiance immersive et intrigue captivante."
         
         enriched = data["candidates"][0]["content"]["parts"][0]["text"].strip()
-        print(f"[EF4.1] Enrichissement GenAI : {enriched}")
+        logger.info("[EF4.1] Enrichissement GenAI : %s", enriched)
+        GENAI_CACHE.put(cache_key, enriched)
         return enriched
         
-    except requests.exceptions.RequestException as e:
-        print(f"[EF4.1] Erreur Réseau : {e} - Utilisation texte original")
-        return text
+    except GenAIError as e:
+        logger.warning("[EF4.1] Erreur Réseau : %s - Utilisation texte original", e)
+        return GENAI_CACHE.get_stale(cache_key) or text
     except Exception as e:
-        print(f"[EF4.1] Erreur GenAI : {e} - Utilisation texte original")
-        return text
+        logger.warning("[EF4.1] Erreur GenAI : %s - Utilisation texte original", e)
+        return GENAI_CACHE.get_stale(cache_key) or text
 
 
 # ============================================================
@@ -268,14 +256,7 @@ def build_query_from_preferences(preferences):
         parts.append(f"Livres similaires à : {preferences['favorite_books']}")
     
     # Intensités (convertir scores Likert en descripteurs)
-    intensities = {
-        'intensity_action': ['calme', 'paisible', 'modéré', 'intense', 'très intense'],
-        'intensity_romance': ['sans romance', 'romance légère', 'romance présente', 'romance importante', 'histoire d\'amour centrale'],
-        'intensity_learning': ['divertissement pur', 'un peu éducatif', 'instructif', 'très éducatif', 'essai pédagogique'],
-        'complexity': ['très simple', 'accessible', 'standard', 'complexe', 'très complexe']
-    }
-    
-    for key, descriptors in intensities.items():
+    for key, descriptors in LIKERT_DESCRIPTORS.items():
         score = preferences.get(key, 3)
         parts.append(descriptors[score - 1])
     
@@ -283,70 +264,62 @@ def build_query_from_preferences(preferences):
     return query
 
 
-def calculate_weighted_similarity(query_emb, book_emb, likert_scores):
-    """
-    EF3.1 : Formule de Score Pondérée
-    Calcul la similarité cosinus pondérée par les préférences Likert
-    """
-    # EF2.3 : Similarité Cosinus de base
-    base_similarity = cosine_similarity(query_emb.reshape(1, -1), book_emb.reshape(1, -1))[0][0]
-    
-    # EF3.1 : Pondération par intensités
-    # Moyenne des scores Likert (normalisée 0-1)
-    avg_intensity = np.mean([
-        likert_scores.get('intensity_action', 3),
-        likert_scores.get('intensity_romance', 3),
-        likert_scores.get('intensity_learning', 3),
-        likert_scores.get('complexity', 3)
-    ]) / 5.0
-    
-    # Score pondéré : 80% similarité + 20% intensité préférences
-    weighted_score = 0.8 * base_similarity + 0.2 * avg_intensity
-    print(f"[EF3.1] Score pondéré : {weighted_score}")
-    return weighted_score
-
-
 # ============================================================
 # EF3.2 : SYSTÈME DE RECOMMANDATION TOP 3
 # ============================================================
 
-def recommend_books(preferences, df, model, embeddings, top_k=3, use_genai=False, api_key=None):
+def recommend_books(preferences, df, model, embeddings, top_k=3, use_genai=False, api_key=None, index=None,
+                    composer=None, metadata=None):
     """
     EF3.2 : Recommandation des Top 3 livres
+    Si un index ANN est fourni, seuls ses candidats sont pondérés (EF3.1)
+    Si un QueryComposer est fourni, le vecteur de requête est composé à partir
+    des descripteurs Likert précalculés (voir query_composer.py)
+    Si un MetadataIndex est fourni, les livres exclus par les préférences
+    ('avoid', 'max_price', 'min_stars'...) sont filtrés avant le scoring
     """
-    print("\n[EF3] Calcul des recommandations...")
+    import pandas as pd
+    
+    logger.info("[EF3] Calcul des recommandations...")
     
     # Construire la requête
-    query_text = build_query_from_preferences(preferences)
+    with timed('build_query'):
+        base_query = build_query_from_preferences(preferences)
     
     # EF4.1 : Enrichissement conditionnel
-    query_text = enrich_short_query(query_text, use_genai, api_key)
-    
-    print(f"\n[EF2.3] Requête finale : {query_text[:200]}...")
-    
-    # Encoder la requête
-    query_emb = model.encode(query_text, convert_to_tensor=False)
-    
-    # Calculer les scores pondérés pour chaque livre
-    scores = []
-    for i in range(len(df)):
-        book_emb = embeddings[i]
-        score = calculate_weighted_similarity(query_emb, book_emb, preferences)
-        scores.append(score)
-    
-    scores = np.array(scores)
-    
-    # EF3.2 : Top 3 recommandations
-    top_indices = np.argsort(-scores)[:top_k]
+    query_text = enrich_short_query(base_query, use_genai, api_key)
+    
+    logger.info("[EF2.3] Requête finale : %s...", query_text[:200])
+    
+    with timed('encode'):
+        if composer is not None and query_text == base_query:
+            # Descripteurs précalculés + texte libre (pas d'encodage sans texte libre)
+            query_emb = composer.compose(preferences)
+        else:
+            # Encoder la requête (cache LRU partagé)
+            query_emb = encode_query(model, query_text)
+    
+    # Pré-filtre des métadonnées (catégories à éviter, prix, étoiles...)
+    exclude = metadata.mask_for(preferences) if metadata is not None else None
+    if exclude is not None:
+        logger.info("[Filtres] %d livres exclus, %d candidats", int(exclude.sum()), int((~exclude).sum()))
+    
+    if index is not None:
+        # Recherche via l'index, pondération appliquée aux candidats (EF3.1)
+        top_indices, similarities = index.search(query_emb, top_k, exclude=exclude)
+        top_scores = weighted_scores(similarities, preferences)
+    else:
+        # Scores pondérés des livres non exclus (EF3.1) puis Top 3 (EF3.2)
+        top_indices, top_scores = top_k_scores(query_emb, embeddings, preferences, top_k, exclude)
     
     recommendations = []
-    for rank, idx in enumerate(top_indices, 1):
+    for rank, (idx, score) in enumerate(zip(top_indices, top_scores), 1):
         rec = {
             'rank': rank,
             'title': df.iloc[idx]['Title'],
             'genre': df.iloc[idx]['Category'],
             'description': df.iloc[idx]['Book_Description'] if pd.notna(df.iloc[idx]['Book_Description']) else "Description non disponible",
-            'similarity_score': float(scores[idx])
+            'similarity_score': float(score)
         }
         recommendations.append(rec)
     
@@ -366,11 +339,10 @@ def generate_personalized_summary(preferences, recommendations, query_text, api_
     if not api_key:
         return "[GenAI désactivé - Aucune clé API fournie]"
     
-    print("\n[EF4.2-4.3] Génération de la synthèse personnalisée (GenAI)...")
+    logger.info("[EF4.2-4.3] Génération de la synthèse personnalisée (GenAI)...")
     
+    cache_key = None
     try:
-        import requests
-        
         # Préparer le contexte
         top_book = recommendations[0]
         
@@ -388,29 +360,31 @@ TÂCHE (120 mots max) :
   
 Réponse concise et directe."""
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "maxOutputTokens": 512,
-                "temperature": 0.7,
-                "topP": 0.9,
-                "topK": 40
-            }
+        generation_config = {
+            "maxOutputTokens": 512,
+            "temperature": 0.7,
+            "topP": 0.9,
+            "topK": 40
         }
         
-        response = requests.post(url, json=payload, timeout=45)
-        data = response.json()
+        # Synthèse déjà en cache pour ce (profil, livre)
+        cache_key = GENAI_CACHE.make_key(prompt, GEMINI_MODEL, generation_config)
+        cached = GENAI_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info("[OK] Synthèse servie depuis le cache GenAI (%d caractères)", len(cached))
+            return cached
+        
+        data = GEMINI_CLIENT.generate(prompt, generation_config, api_key, deadline=SUMMARY_DEADLINE)
         
         # Vérifier les erreurs API
         if 'error' in data:
             error_msg = data['error'].get('message', 'Erreur inconnue')
-            print(f"[Erreur API Gemini] {error_msg}")
-            return f"[Erreur GenAI : {error_msg}]"
+            logger.error("[Erreur API Gemini] %s", error_msg)
+            return GENAI_CACHE.get_stale(cache_key) or f"[Erreur GenAI : {error_msg}]"
         
         if 'candidates' not in data or not data['candidates']:
-            print(f"[Erreur] Réponse API invalide : {data}")
-            return "[Erreur GenAI : Réponse vide ou invalide de l'API]"
+            logger.error("[Erreur] Réponse API invalide : %s", data)
+            return GENAI_CACHE.get_stale(cache_key) or "[Erreur GenAI : Réponse vide ou invalide de l'API]"
         
         # Vérifier la raison de fin
         candidate = data["candidates"][0]
@@ -418,26 +392,27 @@ Réponse concise et directe."""
         
         if finish_reason in ["MAX_TOKENS", "STOP", "SAFETY", "RECITATION"]:
             if finish_reason == "MAX_TOKENS":
-                print(f"[Avertissement] Réponse tronquée - Limite de tokens atteinte")
+                logger.warning("[Avertissement] Réponse tronquée - Limite de tokens atteinte")
             elif finish_reason != "STOP":
-                print(f"[Avertissement] Génération arrêtée : {finish_reason}")
+                logger.warning("[Avertissement] Génération arrêtée : %s", finish_reason)
         
         # Concaténer TOUTES les parts (pas seulement la première)
         parts = candidate["content"]["parts"]
         summary = "".join(part.get("text", "") for part in parts if "text" in part).strip()
         
         if not summary:
-            print(f"[Erreur] Aucun texte dans la réponse : {data}")
-            return "[Erreur GenAI : Réponse vide]"
+            logger.error("[Erreur] Aucun texte dans la réponse : %s", data)
+            return GENAI_CACHE.get_stale(cache_key) or "[Erreur GenAI : Réponse vide]"
         
-        print(f"[OK] Synthèse générée ({len(summary)} caractères, finishReason: {finish_reason})")
+        logger.info("[OK] Synthèse générée (%d caractères, finishReason: %s)", len(summary), finish_reason)
+        GENAI_CACHE.put(cache_key, summary)
         return summary
         
-    except requests.exceptions.RequestException as e:
-        print(f"[Erreur Réseau] {e}")
-        return f"[Erreur GenAI - Réseau : {e}]"
+    except GenAIError as e:
+        logger.error("[Erreur Réseau] %s", e)
+        return GENAI_CACHE.get_stale(cache_key) or f"[Erreur GenAI - Réseau : {e}]"
     except Exception as e:
-        return f"[Erreur GenAI : {e}]"
+        return GENAI_CACHE.get_stale(cache_key) or f"[Erreur GenAI : {e}]"
 
 
 # ============================================================
@@ -487,6 +462,9 @@ def main():
     """
     Pipeline complet du système de recommandation
     """
+    # Messages du pipeline (LOG_LEVEL=DEBUG pour le détail des scores)
+    configure_logging()
+    
     print("\n" + "="*80)
     print("  SYSTEME DE RECOMMANDATION LITTERAIRE - SBERT + GenAI")
     print("  Projet EFREI M1 Data Engineering - IA Générative")
@@ -501,6 +479,12 @@ def main():
     else:
         print("\n[CONFIG] Mode sans GenAI (scoring pur)")
     
+    # Chargement du modèle SBERT en arrière-plan pendant le questionnaire
+    # (ENCODER_BACKEND = torch | onnx | onnx-int8)
+    model = load_encoder(MODEL_NAME)
+    if os.getenv("SBERT_PRELOAD", "1") == "1":
+        model.preload()
+    
     # EF1 : Acquisition des données
     preferences = collect_user_preferences()
     
@@ -508,14 +492,33 @@ def main():
     df = load_knowledge_base()
     
     # EF2.2 : Embeddings SBERT
-    model, embeddings = load_sbert_and_embeddings(df)
+    model, embeddings = load_sbert_and_embeddings(
+        df, dtype=os.getenv("EMBEDDING_DTYPE", "float32"), model=model
+    )
+    
+    # Index de recherche (BOOK_INDEX = exact | ivf | hnsw)
+    index = load_or_build_index(
+        embeddings,
+        method=os.getenv("BOOK_INDEX", "exact"),
+        path=os.getenv("BOOK_INDEX_PATH"),
+        manifest=read_manifest()
+    )
+    
+    # Requêtes composées (QUERY_COMPOSE = string | combinations | descriptors)
+    composer = load_composer(model)
+    
+    # Filtres de métadonnées (catégories, prix, étoiles, disponibilité)
+    metadata = MetadataIndex.from_catalogue(df)
     
     # EF3 : Recommandations
     recommendations, query_text = recommend_books(
         preferences, df, model, embeddings,
         top_k=3,
         use_genai=USE_GENAI,
-        api_key=GEMINI_API_KEY
+        api_key=GEMINI_API_KEY,
+        index=index,
+        composer=composer,
+        metadata=metadata
     )
     
     # EF4.2-4.3 : Synthèse GenAI
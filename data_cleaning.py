@@ -1,9 +1,46 @@
 """
 Module de nettoyage des données pour le système de recommandation de livres.
 Sépare la logique de nettoyage du mécanisme de scoring.
+
+load_catalogue() est le chargeur partagé par la CLI, l'application web et
+l'analyse : le catalogue nettoyé est sauvegardé dans un snapshot colonnaire
+(Parquet si pyarrow est installé, sinon pickle pandas), indexé par le hash du
+CSV, et relu directement au démarrage suivant.
 """
 
-import pandas as pd
+import hashlib
+import json
+import importlib.util
+import logging
+import os
+import pickle
+import re
+
+# pandas est importé dans les fonctions : importer ce module reste quasi gratuit
+
+# Moteur Parquet optionnel (pyarrow), détecté sans l'importer
+SNAPSHOT_FORMAT = 'parquet' if importlib.util.find_spec("pyarrow") else 'pickle'
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque changement de la logique de nettoyage
+CLEANING_VERSION = 2
+DEFAULT_SNAPSHOT_PATH = "catalogue_snapshot"
+
+# Descriptions scrapées : accroche tronquée ("... love th") suivie du texte
+# complet qui reprend le même début. L'accroche est détectée par la
+# réapparition des TEASER_PREFIX premiers caractères entre TEASER_MIN_LENGTH
+# et TEASER_MAX_LENGTH caractères (accroches du CSV : 240 à 440), puis supprimée.
+TEASER_PREFIX = 40
+TEASER_MIN_LENGTH = 100
+TEASER_MAX_LENGTH = 600
+TEASER_REPEAT = re.compile(
+    rf"^(.{{{TEASER_PREFIX}}})"
+    rf".{{{TEASER_MIN_LENGTH - TEASER_PREFIX},{TEASER_MAX_LENGTH - TEASER_PREFIX}}}?\s*(?=\1)",
+    re.DOTALL
+)
+# Lien "...more" du scraping en fin de description
+MORE_SUFFIX = re.compile(r"\s*\.{3}\s*more\s*$")
 
 
 def clean_text(text):
@@ -16,9 +53,50 @@ def clean_text(text):
     Returns:
         Texte nettoyé et normalisé (minuscules, espaces supprimés)
     """
+    import pandas as pd
     return str(text).strip().lower() if pd.notna(text) else ""
 
 
+def clean_column(series):
+    """
+    Version vectorisée de clean_text() pour une colonne entière.
+
+    Args:
+        series: Colonne pandas
+
+    Returns:
+        Colonne de chaînes nettoyées (minuscules, espaces supprimés, "" si absent)
+    """
+    return series.fillna("").astype(str).str.strip().str.lower()
+
+
+def count_words(series):
+    """Nombre de mots (approximation du nombre de tokens) de chaque texte."""
+    return series.str.count(r"\S+")
+
+
+def dedupe_descriptions(series):
+    """
+    Supprime l'accroche répétée et le suffixe "...more" des descriptions.
+
+    Args:
+        series: Colonne de descriptions nettoyées (clean_column)
+
+    Returns:
+        (colonne dédupliquée, statistiques {'teasers', 'more_suffixes',
+        'words_before', 'words_after'})
+    """
+    without_teaser = series.str.replace(TEASER_REPEAT, "", regex=True)
+    deduped = without_teaser.str.replace(MORE_SUFFIX, "", regex=True)
+    stats = {
+        'teasers': int((without_teaser.str.len() < series.str.len()).sum()),
+        'more_suffixes': int((deduped.str.len() < without_teaser.str.len()).sum()),
+        'words_before': int(count_words(series).sum()),
+        'words_after': int(count_words(deduped).sum())
+    }
+    return deduped, stats
+
+
 def load_and_clean_dataset(path="Book_Dataset_1.csv"):
     """
     Charge et nettoie le dataset de livres.
@@ -28,6 +106,7 @@ def load_and_clean_dataset(path="Book_Dataset_1.csv"):
     - Filtrage des catégories invalides (vides, 'default', 'add a comment')
     - Suppression des lignes sans titre
     - Nettoyage du texte (titres, descriptions, catégories)
+    - Suppression des accroches répétées et des "...more" des descriptions
     - Création d'un texte complet pour les embeddings
     
     Args:
@@ -40,7 +119,9 @@ def load_and_clean_dataset(path="Book_Dataset_1.csv"):
         - genre_clean: Catégorie nettoyée
         - text_full: Texte complet pour embeddings
     """
-    print("\n[Nettoyage] Chargement du dataset...")
+    import pandas as pd
+    
+    logger.info("[Nettoyage] Chargement du dataset...")
     
     # Chargement
     df = pd.read_csv(path, sep=',', encoding='latin1')
@@ -48,7 +129,7 @@ def load_and_clean_dataset(path="Book_Dataset_1.csv"):
     
     # Suppression des doublons
     df = df.drop_duplicates()
-    print(f"[OK] Doublons supprimés : {original_count - len(df)}")
+    logger.info("[OK] Doublons supprimés : %d", original_count - len(df))
     
     # Filtrage des catégories invalides
     df = df[
@@ -56,15 +137,21 @@ def load_and_clean_dataset(path="Book_Dataset_1.csv"):
         (df['Category'].str.lower() != 'default') &
         (df['Category'].str.lower() != 'add a comment')
     ]
-    print(f"[OK] Catégories invalides supprimées : {original_count - len(df)}")
+    logger.info("[OK] Catégories invalides supprimées : %d", original_count - len(df))
     
     # Suppression des lignes sans titre
     df = df.dropna(subset=['Title'])
     
-    # Nettoyage du texte pour créer le corpus final
-    df['title_clean'] = df['Title'].apply(clean_text)
-    df['desc_clean'] = df['Book_Description'].apply(clean_text)
-    df['genre_clean'] = df['Category'].apply(clean_text)
+    # Nettoyage du texte pour créer le corpus final (opérations .str vectorisées)
+    df['title_clean'] = clean_column(df['Title'])
+    df['desc_clean'], dedupe = dedupe_descriptions(clean_column(df['Book_Description']))
+    df['genre_clean'] = clean_column(df['Category'])
+    
+    saved = dedupe['words_before'] - dedupe['words_after']
+    logger.info("[OK] Descriptions dédupliquées : %d accroches répétées, %d '...more' supprimés",
+                dedupe['teasers'], dedupe['more_suffixes'])
+    logger.info("[OK] Mots des descriptions : %d -> %d (-%.0f%%)",
+                dedupe['words_before'], dedupe['words_after'], 100 * saved / max(1, dedupe['words_before']))
     
     # Création du texte complet pour embeddings
     df['text_full'] = (
@@ -73,11 +160,97 @@ def load_and_clean_dataset(path="Book_Dataset_1.csv"):
         df['desc_clean']
     )
     
-    print(f"[OK] {len(df)} livres nettoyés et prêts")
+    logger.info("[OK] %d livres nettoyés et prêts", len(df))
     
     return df
 
 
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Hash SHA-256 du contenu d'un fichier.
+
+    Args:
+        path: Chemin du fichier
+        chunk_size: Taille des blocs lus
+
+    Returns:
+        Empreinte hexadécimale
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_files(snapshot_path):
+    extension = 'parquet' if SNAPSHOT_FORMAT == 'parquet' else 'pkl'
+    return f"{snapshot_path}.{extension}", f"{snapshot_path}.json"
+
+
+def load_catalogue(path="Book_Dataset_1.csv", snapshot_path=DEFAULT_SNAPSHOT_PATH, use_snapshot=True):
+    """
+    Charge le catalogue nettoyé depuis le snapshot, ou le reconstruit.
+
+    Le snapshot est réutilisé tant que le hash du CSV, la version du
+    nettoyage, le format et la version de pandas correspondent à son
+    manifeste ; sinon (ou s'il est illisible, par exemple tronqué) le CSV
+    est nettoyé par load_and_clean_dataset() et le snapshot réécrit.
+
+    Args:
+        path: Chemin vers le fichier CSV
+        snapshot_path: Chemin du snapshot (sans extension)
+        use_snapshot: False pour forcer le nettoyage depuis le CSV
+
+    Returns:
+        DataFrame nettoyé (mêmes colonnes que load_and_clean_dataset)
+    """
+    import pandas as pd
+    
+    if not use_snapshot:
+        return load_and_clean_dataset(path)
+
+    data_path, manifest_path = _snapshot_files(snapshot_path)
+    expected = {
+        'csv_hash': hash_file(path),
+        'cleaning_version': CLEANING_VERSION,
+        'format': SNAPSHOT_FORMAT,
+        'pandas_version': pd.__version__
+    }
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if all(manifest.get(key) == value for key, value in expected.items()):
+            if SNAPSHOT_FORMAT == 'parquet':
+                df = pd.read_parquet(data_path)
+            else:
+                df = pd.read_pickle(data_path)
+            logger.info("[OK] %d livres chargés depuis le snapshot %s", len(df), data_path)
+            return df
+    except (OSError, ValueError, EOFError, AttributeError, ImportError, pickle.UnpicklingError) as e:
+        if os.path.exists(manifest_path):
+            logger.warning("[Nettoyage] Snapshot illisible (%s) - Reconstruction", e)
+
+    df = load_and_clean_dataset(path)
+
+    try:
+        tmp_path = f"{data_path}.tmp{os.getpid()}"
+        if SNAPSHOT_FORMAT == 'parquet':
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, data_path)
+        with open(f"{manifest_path}.tmp{os.getpid()}", 'w', encoding='utf-8') as f:
+            json.dump({**expected, 'rows': len(df)}, f, indent=2)
+        os.replace(f"{manifest_path}.tmp{os.getpid()}", manifest_path)
+        logger.info("[OK] Snapshot du catalogue sauvegardé dans %s", data_path)
+    except (OSError, ValueError) as e:
+        logger.warning("[Nettoyage] Snapshot non sauvegardé : %s", e)
+
+    return df
+
+
 def get_statistics(df):
     """
     Retourne des statistiques sur le dataset nettoyé.
@@ -0,0 +1,306 @@
+"""
+Store d'embeddings versionné et mappé en mémoire (remplace embeddings_books.pkl).
+
+Structure du répertoire :
+- embeddings.npy : matrice (n_livres, dim) normalisée L2, float32 ou float16
+- row_ids.npy    : clé de chaque ligne (hash SHA-256 de son text_full)
+- manifest.json  : modèle, dimension, nombre de lignes, dtype, hash du texte
+                   et hash de row_ids.npy
+
+Le fichier .npy est ouvert avec np.memmap (np.load(mmap_mode='r')) : plusieurs
+workers gunicorn partagent ainsi la même copie dans le cache de pages du
+système au lieu de désérialiser chacun un tableau privé. Le store est
+reconstruit automatiquement si le manifeste ne correspond plus au catalogue ;
+en mode incrémental, seules les lignes nouvelles ou modifiées sont réencodées.
+
+Un store par recette de texte et par modèle (store_path) : le recommandeur
+(text_full) utilise le répertoire racine, les autres recettes (par exemple
+titre + description pour analysis_improved.py) un sous-répertoire recipes/.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+from scoring import normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_STORE_PATH = "embeddings_store"
+EMBEDDINGS_FILE = "embeddings.npy"
+ROW_IDS_FILE = "row_ids.npy"
+MANIFEST_FILE = "manifest.json"
+RECIPES_DIR = "recipes"
+DEFAULT_RECIPE = "text_full"
+
+
+def hash_texts(texts):
+    """
+    Hash SHA-256 d'une séquence de textes (colonne text_full).
+
+    Args:
+        texts: Itérable de chaînes
+
+    Returns:
+        Empreinte hexadécimale, sensible à l'ordre et au contenu
+    """
+    digest = hashlib.sha256()
+    for text in texts:
+        data = str(text).encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def hash_rows(texts):
+    """
+    Clé de contenu de chaque livre : hash SHA-256 de son texte.
+
+    Args:
+        texts: Itérable de chaînes
+
+    Returns:
+        Tableau (n_livres,) de hashes hexadécimaux (dtype S64)
+    """
+    return np.array(
+        [hashlib.sha256(str(text).encode('utf-8')).hexdigest() for text in texts],
+        dtype='S64'
+    )
+
+
+def hash_row_ids(row_ids):
+    """Empreinte SHA-256 du tableau row_ids (enregistrée dans le manifeste)."""
+    return hashlib.sha256(np.ascontiguousarray(row_ids, dtype='S64').tobytes()).hexdigest()
+
+
+def store_path(recipe=DEFAULT_RECIPE, model_name=MODEL_NAME, root=DEFAULT_STORE_PATH):
+    """
+    Répertoire du store d'une recette de texte pour un modèle.
+
+    Args:
+        recipe: Nom de la recette ('text_full' = texte du recommandeur)
+        model_name: Nom du modèle SBERT
+        root: Répertoire racine des stores
+
+    Returns:
+        root pour la recette et le modèle du recommandeur,
+        sinon root/recipes/<recette>__<modèle>
+    """
+    if recipe == DEFAULT_RECIPE and model_name == MODEL_NAME:
+        return root
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "-", f"{recipe}__{model_name}")
+    return os.path.join(root, RECIPES_DIR, slug)
+
+
+def read_manifest(path=DEFAULT_STORE_PATH):
+    """
+    Lit le manifeste du store.
+
+    Returns:
+        Dictionnaire du manifeste, ou None s'il est absent ou illisible
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(filepath, data):
+    tmp_path = f"{filepath}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+
+
+def manifest_matches(manifest, text_hash, n_rows, model_name=MODEL_NAME, dtype='float32'):
+    """
+    Vérifie que le manifeste correspond au catalogue et au modèle courants.
+    """
+    if not manifest:
+        return False
+    return (
+        manifest.get('model_name') == model_name and
+        manifest.get('n_rows') == n_rows and
+        manifest.get('text_hash') == text_hash and
+        manifest.get('dtype') == np.dtype(dtype).name
+    )
+
+
+def open_store(path=DEFAULT_STORE_PATH):
+    """
+    Ouvre la matrice d'embeddings en lecture seule (np.memmap, sans copie).
+
+    Args:
+        path: Répertoire du store
+
+    Returns:
+        Tableau np.memmap (n_livres, dim)
+    """
+    embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r')
+    manifest = read_manifest(path)
+    if manifest and embeddings.shape != (manifest['n_rows'], manifest['dim']):
+        raise ValueError(f"Store {path} incohérent avec son manifeste")
+    return embeddings
+
+
+def write_store(path, texts, encode, model_name=MODEL_NAME, dtype='float32', chunk_size=4096, incremental=False):
+    """
+    Encode les textes par blocs et écrit un nouveau store.
+
+    Les blocs sont écrits directement dans un .npy mappé en mémoire (la
+    matrice complète n'est jamais tenue en RAM) ; les fichiers sont
+    remplacés atomiquement, le manifeste en dernier. L'ancien store est
+    fermé avant le remplacement (un fichier mappé ne peut pas être
+    remplacé sous Windows).
+
+    Args:
+        path: Répertoire du store
+        texts: Liste des textes à encoder (text_full)
+        encode: Fonction liste de textes -> matrice d'embeddings
+        model_name: Nom du modèle enregistré dans le manifeste
+        dtype: 'float32' ou 'float16'
+        chunk_size: Nombre de textes encodés par bloc
+        incremental: Réutiliser le store existant du même modèle ; les lignes
+            dont le hash y figure sont copiées (converties en dtype) au lieu
+            d'être encodées
+
+    Returns:
+        Dictionnaire du manifeste écrit
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, f"{EMBEDDINGS_FILE}.tmp{os.getpid()}")
+    row_ids = hash_rows(texts)
+
+    # Ligne source dans l'ancien store pour chaque livre (-1 = à encoder)
+    source_rows = np.full(len(texts), -1, dtype=np.int64)
+    matrix = None
+    removed = None
+    previous = _load_previous(path, model_name, dtype) if incremental else None
+    if previous is not None:
+        old_embeddings, old_row_ids = previous
+        known = {row_id: i for i, row_id in enumerate(old_row_ids)}
+        source_rows = np.array([known.get(row_id, -1) for row_id in row_ids], dtype=np.int64)
+        removed = len(set(old_row_ids) - set(row_ids))
+        reused = np.flatnonzero(source_rows >= 0)
+        if len(reused):
+            matrix = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=dtype, shape=(len(texts), old_embeddings.shape[1])
+            )
+            for start in range(0, len(reused), chunk_size):
+                rows = reused[start:start + chunk_size]
+                matrix[rows] = old_embeddings[source_rows[rows]]
+        # Lignes copiées : l'ancien fichier mappé peut être libéré
+        del old_embeddings, old_row_ids, known, previous
+
+    missing = np.flatnonzero(source_rows < 0)
+    for start in range(0, len(missing), chunk_size):
+        rows = missing[start:start + chunk_size]
+        chunk = normalize_embeddings(encode([texts[i] for i in rows]))
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=dtype, shape=(len(texts), chunk.shape[1])
+            )
+        matrix[rows] = chunk
+    if matrix is None:
+        raise ValueError("Aucun texte à encoder")
+    dim = matrix.shape[1]
+    matrix.flush()
+    del matrix
+
+    if removed is not None:
+        logger.info(
+            "[Store] Mise à jour incrémentale : %d réutilisés, %d encodés, %d supprimés",
+            len(texts) - len(missing), len(missing), removed
+        )
+
+    ids_tmp_path = os.path.join(path, f"{ROW_IDS_FILE}.tmp{os.getpid()}.npy")
+    np.save(ids_tmp_path, row_ids)
+    os.replace(tmp_path, os.path.join(path, EMBEDDINGS_FILE))
+    os.replace(ids_tmp_path, os.path.join(path, ROW_IDS_FILE))
+
+    manifest = {
+        'model_name': model_name,
+        'dim': int(dim),
+        'n_rows': len(texts),
+        'dtype': np.dtype(dtype).name,
+        'normalized': True,
+        'text_hash': hash_texts(texts),
+        'row_ids_hash': hash_row_ids(row_ids),
+        'created': datetime.now().isoformat()
+    }
+    _write_json_atomic(os.path.join(path, MANIFEST_FILE), manifest)
+    return manifest
+
+
+def _load_previous(path, model_name, dtype):
+    """
+    Ancien store réutilisable (même modèle), ou None.
+
+    Un store d'un autre dtype reste réutilisable : write_store convertit les
+    lignes copiées au lieu de réencoder tout le catalogue.
+
+    embeddings.npy et row_ids.npy sont remplacés l'un après l'autre : row_ids
+    est vérifié contre le manifeste pour écarter un store interrompu entre
+    les deux remplacements.
+    """
+    manifest = read_manifest(path)
+    if not manifest or manifest.get('model_name') != model_name:
+        return None
+    try:
+        embeddings = open_store(path)
+        row_ids = np.load(os.path.join(path, ROW_IDS_FILE))
+    except (OSError, ValueError):
+        return None
+    expected_hash = manifest.get('row_ids_hash')
+    if len(row_ids) != manifest.get('n_rows') or (expected_hash and hash_row_ids(row_ids) != expected_hash):
+        logger.warning("[Store] row_ids.npy incohérent avec le manifeste - Reconstruction complète")
+        return None
+    return embeddings, row_ids
+
+
+def load_or_build_store(texts, encode, path=DEFAULT_STORE_PATH, model_name=MODEL_NAME, dtype='float32',
+                        incremental=True):
+    """
+    Ouvre le store s'il correspond au catalogue, sinon le reconstruit.
+
+    En mode incrémental, un store existant du même modèle est mis à jour :
+    seules les lignes nouvelles ou modifiées sont encodées, les lignes
+    supprimées du catalogue disparaissent du store.
+
+    Args:
+        texts: Liste des textes du catalogue (text_full)
+        encode: Fonction liste de textes -> matrice d'embeddings
+        path: Répertoire du store
+        model_name: Nom du modèle SBERT
+        dtype: 'float32' ou 'float16' (moitié moins de disque ; à convertir en
+            float32 pour le scoring, voir scoring.scoring_matrix)
+        incremental: Réutiliser les vecteurs des lignes inchangées (y compris
+            après un changement de dtype : les lignes sont converties)
+
+    Returns:
+        Matrice normalisée (np.memmap) prête pour le scoring
+    """
+    texts = list(texts)
+    text_hash = hash_texts(texts)
+
+    if manifest_matches(read_manifest(path), text_hash, len(texts), model_name, dtype):
+        try:
+            embeddings = open_store(path)
+            logger.info("[OK] Embeddings mappés depuis %s (memmap)", path)
+            return embeddings
+        except (OSError, ValueError) as e:
+            logger.warning("[Store] Store illisible (%s) - Reconstruction", e)
+    else:
+        logger.info("[Store] Manifeste absent ou obsolète - Génération des embeddings...")
+
+    write_store(path, texts, encode, model_name, dtype, incremental=incremental)
+    logger.info("[OK] Embeddings sauvegardés dans %s", path)
+    return open_store(path)
@@ -0,0 +1,300 @@
+"""
+Backends d'encodage SBERT : PyTorch (sentence-transformers) ou ONNX Runtime.
+
+all-MiniLM-L6-v2 est exporté une fois en ONNX (optionnellement quantifié
+en int8 dynamique) puis exécuté par onnxruntime sur CPU avec un nombre de
+threads fixe, sans charger torch. Le pooling (moyenne masquée) et la
+normalisation L2 reproduisent ceux du modèle sentence-transformers : les
+embeddings restent compatibles avec le store existant, ce que vérifie la
+commande validate (accord cosinus avec la sortie PyTorch).
+
+Sélection du backend : ENCODER_BACKEND = torch | onnx | onnx-int8
+
+Utilisation :
+    python encoder_backend.py export            # onnx_model/model.onnx + model_int8.onnx
+    python encoder_backend.py validate --backend onnx-int8 --min-cosine 0.99
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+from embedding_store import MODEL_NAME
+from lazy_loading import LazySentenceTransformer
+from metrics import configure_logging
+
+
+BACKENDS = ['torch', 'onnx', 'onnx-int8']
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", str(min(4, os.cpu_count() or 1))))
+
+ONNX_FILES = {'onnx': "model.onnx", 'onnx-int8': "model_int8.onnx"}
+CONFIG_FILE = "encoder_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxSentenceEncoder:
+    """
+    Encodeur SBERT exécuté par onnxruntime (sans torch).
+
+    encode() accepte les mêmes arguments que SentenceTransformer.encode()
+    (convert_to_tensor, show_progress_bar, etc. sont ignorés) et retourne
+    des embeddings numpy float32 normalisés.
+
+    Args:
+        model_dir: Dossier produit par export_onnx()
+        quantized: Utiliser model_int8.onnx au lieu de model.onnx
+        num_threads: Threads intra-opérateur d'onnxruntime
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False, num_threads=ENCODER_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+        self.tokenizer.enable_padding(
+            pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token']
+        )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = ONNX_FILES['onnx-int8' if quantized else 'onnx']
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': mask,
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        # Pooling moyen sur les tokens non masqués, puis normalisation L2
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.config.get('normalize', True):
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.clip(norms, 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else [str(t) for t in sentences]
+        if not texts:
+            return np.zeros((0, self.config['dim']), dtype=np.float32)
+
+        # Lots de longueurs proches : moins de padding
+        order = np.argsort([-len(t) for t in texts], kind='stable')
+        out = np.empty((len(texts), self.config['dim']), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([texts[i] for i in rows])
+        return out[0] if single else out
+
+
+class LazyOnnxEncoder(LazySentenceTransformer):
+    """LazySentenceTransformer dont le modèle est un OnnxSentenceEncoder."""
+
+    def __init__(self, model_name, model_dir=ONNX_MODEL_DIR, quantized=False, num_threads=ENCODER_THREADS):
+        super().__init__(model_name)
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.num_threads = num_threads
+
+    def _build(self):
+        return OnnxSentenceEncoder(self.model_dir, self.quantized, self.num_threads)
+
+
+def onnx_available(model_dir=ONNX_MODEL_DIR, backend='onnx'):
+    """True si onnxruntime, tokenizers et le modèle exporté sont présents."""
+    if importlib.util.find_spec("onnxruntime") is None or importlib.util.find_spec("tokenizers") is None:
+        return False
+    return all(
+        os.path.exists(os.path.join(model_dir, name))
+        for name in (ONNX_FILES[backend], CONFIG_FILE, TOKENIZER_FILE)
+    )
+
+
+def load_encoder(model_name=MODEL_NAME, backend=ENCODER_BACKEND, model_dir=ONNX_MODEL_DIR,
+                 num_threads=ENCODER_THREADS):
+    """
+    Retourne l'encodeur (chargé paresseusement) du backend demandé.
+
+    Si onnxruntime ou le modèle exporté est absent, repli sur PyTorch.
+
+    Args:
+        model_name: Nom du modèle SBERT
+        backend: 'torch', 'onnx' ou 'onnx-int8'
+        model_dir: Dossier du modèle exporté
+        num_threads: Threads onnxruntime
+
+    Returns:
+        LazySentenceTransformer ou LazyOnnxEncoder
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (attendu : {', '.join(BACKENDS)})")
+    if backend == 'torch':
+        return LazySentenceTransformer(model_name)
+    if not onnx_available(model_dir, backend):
+        logger.warning("[Encodeur] Backend %s indisponible (onnxruntime/tokenizers ou %s/ manquant, "
+                       "voir 'python encoder_backend.py export') - Repli sur PyTorch", backend, model_dir)
+        return LazySentenceTransformer(model_name)
+    logger.info("[Encodeur] Backend %s (%s threads)", backend, num_threads)
+    return LazyOnnxEncoder(model_name, model_dir, backend == 'onnx-int8', num_threads)
+
+
+def export_onnx(model_name=MODEL_NAME, output_dir=ONNX_MODEL_DIR, quantize=True, opset=14):
+    """
+    Exporte le transformer du modèle SBERT en ONNX (et sa version int8).
+
+    Args:
+        model_name: Nom du modèle SBERT
+        output_dir: Dossier de sortie
+        quantize: Produire aussi model_int8.onnx (quantification dynamique)
+        opset: Version d'opset ONNX
+
+    Returns:
+        Chemin du dossier de sortie
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["exemple de requête"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    onnx_path = os.path.join(output_dir, ONNX_FILES['onnx'])
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    print(f"[OK] Modèle ONNX exporté : {onnx_path}")
+
+    config = {
+        'model_name': model_name,
+        'dim': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model)
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(output_dir, ONNX_FILES['onnx-int8'])
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"[OK] Modèle int8 exporté : {int8_path}")
+
+    return output_dir
+
+
+def cosine_agreement(reference, candidate):
+    """
+    Cosinus ligne à ligne entre deux matrices d'embeddings.
+
+    Returns:
+        Dictionnaire {'min', 'mean', 'p01'} des cosinus
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosines = (reference * candidate).sum(axis=1) / np.clip(norms, 1e-12, None)
+    # Deux vecteurs nuls (texte vide) sont considérés en accord
+    cosines[~reference.any(axis=1) & ~candidate.any(axis=1)] = 1.0
+    return {
+        'min': float(cosines.min()),
+        'mean': float(cosines.mean()),
+        'p01': float(np.percentile(cosines, 1))
+    }
+
+
+def validate_backend(texts, backend='onnx-int8', model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR,
+                     num_threads=ENCODER_THREADS, batch_size=32):
+    """
+    Compare les embeddings ONNX à ceux de PyTorch sur les mêmes textes.
+
+    Args:
+        texts: Textes de validation (ex. text_full du catalogue)
+        backend: 'onnx' ou 'onnx-int8'
+
+    Returns:
+        Dictionnaire d'accord cosinus (voir cosine_agreement) + 'n_texts'
+    """
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device='cpu').encode(
+        texts, batch_size=batch_size, convert_to_tensor=False, normalize_embeddings=True
+    )
+    candidate = OnnxSentenceEncoder(model_dir, backend == 'onnx-int8', num_threads).encode(
+        texts, batch_size=batch_size
+    )
+    report = cosine_agreement(reference, candidate)
+    report['n_texts'] = len(texts)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export et validation du backend ONNX de SBERT")
+    parser.add_argument('command', choices=['export', 'validate'])
+    parser.add_argument('--output-dir', default=ONNX_MODEL_DIR)
+    parser.add_argument('--no-int8', action='store_true', help="export : ne pas quantifier")
+    parser.add_argument('--backend', choices=['onnx', 'onnx-int8'], default='onnx-int8')
+    parser.add_argument('--sample', type=int, default=500,
+                        help="validate : nombre de livres du catalogue comparés")
+    parser.add_argument('--min-cosine', type=float, default=0.99,
+                        help="validate : cosinus minimal exigé ; code de sortie 1 sinon")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'export':
+        export_onnx(output_dir=args.output_dir, quantize=not args.no_int8)
+        return
+
+    from data_cleaning import load_catalogue
+
+    df = load_catalogue("Book_Dataset_1.csv")
+    texts = df['text_full'].sample(min(args.sample, len(df)), random_state=42).tolist()
+    report = validate_backend(texts, args.backend, model_dir=args.output_dir)
+    ok = report['min'] >= args.min_cosine
+    print(f"[Validation] {args.backend} vs PyTorch sur {report['n_texts']} textes : "
+          f"cosinus min={report['min']:.4f} p01={report['p01']:.4f} moyen={report['mean']:.4f} "
+          f"-> {'OK' if ok else 'ÉCHEC'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
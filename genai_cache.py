@@ -0,0 +1,159 @@
+"""
+Cache persistant (SQLite) des réponses GenAI.
+
+enrich_short_query(), generate_personalized_summary() et
+generate_genai_summary() rappelaient Gemini à chaque fois, même pour un
+prompt identique. Les réponses sont stockées sur disque, indexées par un
+hash (prompt, modèle, configuration de génération), avec une durée de vie,
+une éviction par taille (moins récemment lues d'abord) et des compteurs.
+Une réponse expirée peut encore servir de repli quand l'API échoue.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from genai_client import GEMINI_MODEL
+
+
+DEFAULT_CACHE_PATH = "genai_cache.sqlite"
+
+logger = logging.getLogger(__name__)
+
+
+class GenAIResponseCache:
+    """
+    Cache clé-valeur SQLite des réponses GenAI.
+
+    Args:
+        path: Fichier SQLite (partagé entre processus, mode WAL)
+        ttl: Durée de vie d'une réponse en secondes (None = illimitée)
+        max_entries: Nombre maximal de réponses conservées
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=7 * 24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed)")
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    @staticmethod
+    def make_key(prompt, model=GEMINI_MODEL, generation_config=None):
+        """
+        Clé de cache : hash SHA-256 du prompt, du modèle et de la configuration.
+        """
+        data = json.dumps(
+            {'prompt': prompt, 'model': model, 'config': generation_config or {}},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key, allow_stale=False):
+        """
+        Retourne la réponse en cache, ou None.
+
+        Args:
+            key: Clé retournée par make_key()
+            allow_stale: Accepter une réponse expirée (repli en cas d'erreur API)
+        """
+        if key is None:
+            return None
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                fresh = row is not None and (self.ttl is None or now - row[1] <= self.ttl)
+                if row is not None and (fresh or allow_stale):
+                    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                if allow_stale:
+                    self.stale_hits += row is not None
+                elif fresh:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        except sqlite3.Error as e:
+            logger.warning("[GenAI Cache] Lecture impossible : %s", e)
+            return None
+        return row[0] if row is not None and (fresh or allow_stale) else None
+
+    def get_stale(self, key):
+        """Réponse même expirée, utilisée quand l'API est en échec."""
+        return self.get(key, allow_stale=True)
+
+    def put(self, key, response):
+        """Enregistre une réponse et évince les moins récemment lues au-delà de max_entries."""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now)
+                )
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning("[GenAI Cache] Écriture impossible : %s", e)
+
+    def stats(self):
+        """Compteurs du cache (hits, misses, réponses expirées servies, taille)."""
+        try:
+            with self._transaction() as conn:
+                size = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl
+        }
+
+
+# Cache partagé par la CLI et l'application Flask
+GENAI_CACHE = GenAIResponseCache(
+    path=os.getenv("GENAI_CACHE_PATH", DEFAULT_CACHE_PATH),
+    ttl=float(os.getenv("GENAI_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("GENAI_CACHE_SIZE", "10000"))
+)
@@ -0,0 +1,267 @@
+"""
+Client HTTP partagé pour les appels GenAI (Google Gemini).
+
+Utilisé par book_recommendation_system.py et app.py à la place des
+requests.post isolés :
+- Session requests poolée (keep-alive, réutilisation des connexions)
+- Budget de latence (deadline) par appel, couvrant toutes les tentatives :
+  la requête s'exécute dans un thread du client et l'appelant n'attend pas
+  au-delà du budget. Le timeout de requests (qui ne borne que chaque
+  opération socket) vaut le budget restant au démarrage de la tentative, et
+  la lecture du corps s'arrête dès l'échéance : un thread en retard libère
+  le pool au plus un timeout socket après l'échéance
+- Nouvelles tentatives avec backoff exponentiel et jitter sur 429/5xx
+- Disjoncteur : après plusieurs échecs consécutifs, l'appel est sauté
+  pendant reset_timeout secondes au lieu d'attendre un timeout
+"""
+
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+from metrics import timed
+
+
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL",
+    f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+)
+
+# Budgets de latence par type d'appel (secondes)
+ENRICH_DEADLINE = float(os.getenv("GENAI_ENRICH_DEADLINE", "10"))
+SUMMARY_DEADLINE = float(os.getenv("GENAI_SUMMARY_DEADLINE", "30"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class GenAIError(Exception):
+    """Échec d'un appel GenAI (réseau, 429/5xx persistants, budget dépassé)."""
+
+
+class CircuitOpenError(GenAIError):
+    """Appel sauté : le disjoncteur est ouvert."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple : ouvert après failure_threshold échecs consécutifs,
+    une tentative d'essai est autorisée après reset_timeout secondes.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """True si l'appel peut être tenté."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Essai unique : réarmé immédiatement en cas de nouvel échec
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """
+    Client Gemini avec session poolée, retries et disjoncteur.
+
+    Args:
+        api_url: URL generateContent (GEMINI_API_URL, surchargeable pour les tests)
+        max_retries: Nombre de nouvelles tentatives sur 429/5xx ou erreur réseau
+        backoff: Délai de base du backoff exponentiel (secondes)
+        max_backoff: Délai maximal entre deux tentatives (secondes)
+        pool_size: Nombre de connexions conservées par hôte
+        breaker: CircuitBreaker partagé (un nouveau par défaut)
+    """
+
+    def __init__(self, api_url=GEMINI_API_URL, max_retries=2, backoff=0.5, max_backoff=4.0,
+                 pool_size=10, breaker=None):
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.skipped = 0
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                # Import différé : requests n'est chargé qu'au premier appel GenAI
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="genai")
+            return self._executor
+
+    def _post(self, payload, api_key, deadline_at):
+        """
+        Une tentative, exécutée dans un thread du pool.
+
+        Le timeout est le budget restant au démarrage effectif du thread (la
+        tâche a pu attendre un thread libre), et le corps est lu par blocs :
+        la lecture s'arrête au premier bloc reçu après l'échéance.
+
+        Returns:
+            Tuple (code HTTP, corps de la réponse en octets)
+
+        Raises:
+            GenAIError: Échéance atteinte avant l'envoi ou pendant la lecture
+        """
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise GenAIError("Échéance atteinte avant l'envoi")
+        with self.session.post(self.api_url, params={'key': api_key}, json=payload,
+                               timeout=remaining, stream=True) as response:
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=1024):
+                if time.monotonic() >= deadline_at:
+                    raise GenAIError("Échéance atteinte pendant la lecture de la réponse")
+                body.extend(chunk)
+            return response.status_code, bytes(body)
+
+    def _sleep_before_retry(self, attempt, deadline_at):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        delay = random.uniform(0, delay)  # Jitter complet
+        remaining = deadline_at - time.monotonic()
+        if delay >= remaining:
+            return False
+        time.sleep(delay)
+        return True
+
+    def generate(self, prompt, generation_config, api_key, deadline=SUMMARY_DEADLINE):
+        """
+        Appelle generateContent et retourne la réponse JSON.
+
+        Les réponses 4xx (hors 429) sont retournées telles quelles : leur clé
+        'error' est traitée par l'appelant comme auparavant.
+
+        Args:
+            prompt: Texte du prompt
+            generation_config: Dictionnaire generationConfig
+            api_key: Clé API Gemini
+            deadline: Budget total en secondes (toutes tentatives comprises)
+
+        Returns:
+            Dictionnaire de la réponse JSON
+
+        Raises:
+            CircuitOpenError: Disjoncteur ouvert, aucun appel effectué
+            GenAIError: Échec réseau ou 429/5xx persistant dans le budget
+        """
+        with timed('genai'):
+            return self._generate(prompt, generation_config, api_key, deadline)
+
+    def _generate(self, prompt, generation_config, api_key, deadline):
+        import requests
+
+        if not self.breaker.allow():
+            self.skipped += 1
+            raise CircuitOpenError("Disjoncteur GenAI ouvert - Appel ignoré")
+
+        self.calls += 1
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+        deadline_at = time.monotonic() + deadline
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                error = GenAIError(f"Budget de {deadline:.1f}s dépassé")
+                break
+            # Le timeout socket ne borne que chaque opération (connexion,
+            # lecture) : l'attente du résultat borne la durée totale
+            future = self.executor.submit(self._post, payload, api_key, deadline_at)
+            try:
+                status_code, body = future.result(timeout=remaining)
+                if status_code not in RETRY_STATUS:
+                    data = json.loads(body)
+                    self.breaker.record_success()
+                    return data
+                error = GenAIError(f"HTTP {status_code}")
+            except (FutureTimeoutError, GenAIError):
+                future.cancel()
+                error = GenAIError(f"Budget de {deadline:.1f}s dépassé")
+                break
+            except requests.exceptions.RequestException as e:
+                error = GenAIError(f"Erreur réseau : {e}")
+            except ValueError as e:
+                error = GenAIError(f"Réponse non JSON : {e}")
+
+            if attempt >= self.max_retries or not self._sleep_before_retry(attempt, deadline_at):
+                break
+            attempt += 1
+            self.retries += 1
+
+        self.errors += 1
+        self.breaker.record_failure()
+        raise error
+
+    def stats(self):
+        """Compteurs du client (appels, erreurs, retries, appels sautés, état du disjoncteur)."""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'skipped': self.skipped,
+            'circuit': self.breaker.state
+        }
+
+
+# Client partagé par la CLI et l'application Flask
+GEMINI_CLIENT = GeminiClient(
+    max_retries=int(os.getenv("GENAI_MAX_RETRIES", "2")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("GENAI_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("GENAI_BREAKER_RESET", "30"))
+    )
+)
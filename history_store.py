@@ -0,0 +1,265 @@
+"""
+Historique append-only (JSONL) des sessions de l'application web.
+
+Remplace la lecture-modification-réécriture complète de user_preferences.json
+et recommendation_results.json à chaque requête : chaque session est ajoutée
+en fin de fichier JSONL par un thread d'écriture qui regroupe les entrées
+(un seul write() en mode O_APPEND par fichier et par lot, sûr entre workers).
+
+Utilisation en ligne de commande :
+    python history_store.py export    # JSONL -> listes JSON *.export.json (format analystes)
+    python history_store.py compact   # réécrit les JSONL sans lignes corrompues
+    python history_store.py compact --import-legacy   # intègre les anciens .json (une fois)
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from metrics import configure_logging, timed
+
+
+PREFERENCES_LOG = "user_preferences.jsonl"
+RESULTS_LOG = "recommendation_results.jsonl"
+PREFERENCES_JSON = "user_preferences.json"
+RESULTS_JSON = "recommendation_results.json"
+# Exports JSON : noms distincts des anciens fichiers, qui restent à importer
+PREFERENCES_EXPORT = "user_preferences.export.json"
+RESULTS_EXPORT = "recommendation_results.export.json"
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """
+    Écrivain de fond pour les fichiers JSONL d'historique.
+
+    Les entrées sont mises en file par append() ; le thread les écrit par
+    lots de max_batch entrées au plus, au moins toutes les flush_interval
+    secondes.
+
+    Args:
+        flush_interval: Délai maximal avant écriture d'une entrée (secondes)
+        max_batch: Nombre maximal d'entrées par lot
+    """
+
+    def __init__(self, flush_interval=0.5, max_batch=256):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Démarre le thread d'écriture (idempotent) et le vidage à la sortie."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        return self
+
+    def append(self, path, entry):
+        """Ajoute une entrée (dictionnaire JSON) au fichier JSONL path."""
+        if self._thread is None:
+            self.start()
+        self._queue.put((path, entry))
+
+    def flush(self, timeout=None):
+        """Attend que toutes les entrées en file soient écrites."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5):
+        """Vide la file puis arrête le thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, events, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    batch.append(item)
+                if stop or events or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                with timed('history'):
+                    self._write(batch)
+            for event in events:
+                event.set()
+            if stop:
+                return
+
+    def _write(self, batch):
+        by_path = defaultdict(list)
+        for path, entry in batch:
+            by_path[path].append(json.dumps(entry, ensure_ascii=False) + "\n")
+        for path, lines in by_path.items():
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, "".join(lines).encode('utf-8'))
+                finally:
+                    os.close(fd)
+                self.written += len(lines)
+            except OSError as e:
+                self.errors += len(lines)
+                logger.error("[Erreur] Écriture de l'historique %s : %s", path, e)
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'written': self.written, 'errors': self.errors}
+
+
+def read_history(path):
+    """
+    Lit un fichier JSONL d'historique.
+
+    Les lignes illisibles (écriture interrompue) sont ignorées.
+
+    Args:
+        path: Fichier JSONL
+
+    Returns:
+        Liste des entrées, dans l'ordre d'écriture
+    """
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def read_legacy(path):
+    """Lit un ancien historique au format liste JSON (ou objet unique)."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except ValueError:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+def export_json(log_path, json_path):
+    """
+    Exporte un historique JSONL au format liste JSON des analystes.
+
+    Returns:
+        Nombre d'entrées exportées
+
+    Raises:
+        ValueError: json_path est un ancien historique (PREFERENCES_JSON,
+            RESULTS_JSON) pas encore importé par compact --import-legacy
+    """
+    if os.path.basename(json_path) in (PREFERENCES_JSON, RESULTS_JSON) and os.path.exists(json_path):
+        raise ValueError(f"{json_path} est un ancien historique non importé "
+                         f"(python history_store.py compact --import-legacy)")
+    entries = read_history(log_path)
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, json_path)
+    return len(entries)
+
+
+def _entry_key(entry):
+    """Clé de contenu d'une entrée (JSON canonique) pour le dédoublonnage."""
+    return json.dumps(entry, sort_keys=True, ensure_ascii=False)
+
+
+def compact(log_path, legacy_path=None):
+    """
+    Réécrit un historique JSONL sans lignes corrompues, en y intégrant
+    éventuellement un ancien fichier liste JSON (placé en tête).
+
+    L'import est unique : les entrées anciennes déjà présentes dans le JSONL
+    (même contenu, par exemple un fichier produit par export) sont ignorées,
+    et le fichier importé est renommé en <fichier>.imported.
+
+    À lancer quand l'application est arrêtée.
+
+    Returns:
+        Nombre d'entrées conservées
+    """
+    entries = read_history(log_path)
+    legacy = read_legacy(legacy_path) if legacy_path else []
+    if legacy:
+        seen = {_entry_key(entry) for entry in entries}
+        new_entries = []
+        for entry in legacy:
+            key = _entry_key(entry)
+            if key not in seen:
+                seen.add(key)
+                new_entries.append(entry)
+        logger.info("[Historique] %s : %d entrées importées, %d déjà présentes",
+                    legacy_path, len(new_entries), len(legacy) - len(new_entries))
+        entries = new_entries + entries
+    tmp_path = f"{log_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, log_path)
+    if legacy_path and os.path.exists(legacy_path):
+        # Fichier intégré : archivé (sans écraser une archive précédente) pour ne pas être réimporté
+        archive = f"{legacy_path}.imported"
+        if os.path.exists(archive):
+            archive = f"{archive}.{time.strftime('%Y%m%d-%H%M%S')}"
+        os.replace(legacy_path, archive)
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outils de l'historique append-only")
+    parser.add_argument('command', choices=['export', 'compact'])
+    parser.add_argument('--import-legacy', action='store_true',
+                        help="compact : intégrer les anciens fichiers .json")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'export':
+        pairs = [(PREFERENCES_LOG, PREFERENCES_EXPORT), (RESULTS_LOG, RESULTS_EXPORT)]
+        for log_path, json_path in pairs:
+            count = export_json(log_path, json_path)
+            print(f"[OK] {count} entrées exportées : {log_path} -> {json_path}")
+        return
+
+    pairs = [(PREFERENCES_LOG, PREFERENCES_JSON), (RESULTS_LOG, RESULTS_JSON)]
+    for log_path, legacy_path in pairs:
+        count = compact(log_path, legacy_path if args.import_legacy else None)
+        print(f"[OK] {log_path} compacté ({count} entrées)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Classifieur hybride centroïdes + k plus proches voisins (analysis_improved.py).
+
+Pour chaque livre de test :
+    score(catégorie) = alpha * cos(livre, centroïde) + beta * votes_kNN / k
+
+Les similarités test x centroïdes et test x train sont calculées par produits
+matriciels sur des lignes normalisées (cosinus identique à
+sklearn.metrics.pairwise.cosine_similarity), par tranches de lignes de test
+(mémoire bornée). Les k voisins sont sélectionnés par argpartition et les
+votes comptés par np.bincount.
+
+Les catégories sont ordonnées par première apparition dans y_train : en cas
+d'égalité des scores, la catégorie retenue est la même que dans la boucle
+d'origine (max() sur le dictionnaire des profils).
+
+    classifier = HybridClassifier(k=5, alpha=0.6, beta=0.4).fit(X_train, y_train)
+    y_pred = classifier.predict(X_test)
+
+Balayage des hyperparamètres (sweep_grid) : les similarités aux centroïdes et
+les K_max voisins sont calculés une fois, puis chaque point (k, alpha, beta)
+n'est plus qu'un comptage de votes et un argmax.
+
+Validation croisée stratifiée (cross_validate) : la matrice d'embeddings est
+écrite une fois en .npy et ouverte en mémoire partagée (memmap) par les
+processus, qui évaluent les plis en parallèle.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score, precision_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import normalize
+
+
+# Taille maximale d'une tranche de similarités test x train (float64)
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def iter_chunks(n_rows, n_cols, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Tranches (début, fin) de lignes telles que n_lignes x n_cols float64 tienne dans le budget."""
+    step = max(1, chunk_bytes // (8 * max(1, n_cols)))
+    for start in range(0, n_rows, step):
+        yield start, min(start + step, n_rows)
+
+
+def nearest_neighbours(X_query, X_train, k, chunk_bytes=DEFAULT_CHUNK_BYTES, normalized=False):
+    """
+    Indices des k voisins les plus similaires (cosinus) de chaque ligne.
+
+    Args:
+        X_query: Matrice (n_query, dim)
+        X_train: Matrice (n_train, dim)
+        k: Nombre de voisins (borné à n_train)
+        chunk_bytes: Taille maximale d'une tranche de similarités
+        normalized: Lignes déjà normalisées (L2)
+
+    Returns:
+        (indices (n_query, k), similarités (n_query, k)), triés par similarité décroissante
+    """
+    if not normalized:
+        X_query, X_train = normalize(X_query), normalize(X_train)
+    k = min(k, len(X_train))
+    indices = np.empty((len(X_query), k), dtype=np.int64)
+    similarities = np.empty((len(X_query), k), dtype=np.float64)
+    for start, end in iter_chunks(len(X_query), len(X_train), chunk_bytes):
+        chunk = X_query[start:end] @ X_train.T
+        if k < chunk.shape[1]:
+            top = np.argpartition(chunk, chunk.shape[1] - k, axis=1)[:, -k:]
+        else:
+            top = np.broadcast_to(np.arange(chunk.shape[1]), chunk.shape)
+        top_sims = np.take_along_axis(chunk, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind='stable')
+        indices[start:end] = np.take_along_axis(top, order, axis=1)
+        similarities[start:end] = np.take_along_axis(top_sims, order, axis=1)
+    return indices, similarities
+
+
+def vote_fractions(neighbour_codes, n_classes, k=None):
+    """
+    Part des voisins de chaque catégorie (votes / k).
+
+    Args:
+        neighbour_codes: Codes de catégorie des voisins (n, >= k)
+        n_classes: Nombre de catégories
+        k: Nombre de voisins pris en compte (les k premières colonnes)
+
+    Returns:
+        Matrice (n, n_classes) des fractions de votes
+    """
+    codes = neighbour_codes if k is None else neighbour_codes[:, :k]
+    n = len(codes)
+    offsets = (codes + n_classes * np.arange(n)[:, None]).ravel()
+    counts = np.bincount(offsets, minlength=n * n_classes).reshape(n, n_classes)
+    return counts / (k or codes.shape[1])
+
+
+class HybridClassifier:
+    """
+    Classifieur hybride centroïdes + k-NN (similarité cosinus).
+
+    Args:
+        k: Nombre de voisins
+        alpha: Poids de la similarité aux centroïdes
+        beta: Poids des votes k-NN
+        chunk_bytes: Taille maximale d'une tranche de similarités
+    """
+
+    def __init__(self, k=5, alpha=0.6, beta=0.4, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        self.k = k
+        self.alpha = alpha
+        self.beta = beta
+        self.chunk_bytes = chunk_bytes
+        self.classes_ = None
+
+    def fit(self, X_train, y_train):
+        """
+        Calcule les centroïdes (moyenne des embeddings) de chaque catégorie.
+
+        Args:
+            X_train: Embeddings d'entraînement (n_train, dim)
+            y_train: Catégories d'entraînement
+
+        Returns:
+            self
+        """
+        X_train = np.asarray(X_train)
+        y_train = np.asarray(y_train)
+        self.classes_ = pd.unique(y_train)
+        self.train_codes_ = pd.Index(self.classes_).get_indexer(y_train)
+        self.centroids_ = np.stack([X_train[y_train == category].mean(axis=0) for category in self.classes_])
+        self.X_train_ = normalize(X_train)
+        self.centroids_normalized_ = normalize(self.centroids_)
+        return self
+
+    def centroid_similarities(self, X):
+        """Similarités cosinus (n, n_catégories) aux centroïdes."""
+        return normalize(np.asarray(X)) @ self.centroids_normalized_.T
+
+    def neighbours(self, X, k=None):
+        """Indices (dans l'entraînement) des k plus proches voisins, par similarité décroissante."""
+        indices, _ = nearest_neighbours(
+            normalize(np.asarray(X)), self.X_train_, k or self.k, self.chunk_bytes, normalized=True
+        )
+        return indices
+
+    def combine(self, centroid_sims, neighbour_indices, k=None, alpha=None, beta=None):
+        """
+        Codes des catégories prédites à partir des similarités déjà calculées.
+
+        Args:
+            centroid_sims: Similarités aux centroïdes (n, n_catégories)
+            neighbour_indices: Voisins par similarité décroissante (n, >= k)
+            k, alpha, beta: Surcharges ponctuelles des hyperparamètres
+
+        Returns:
+            Codes (n,) des catégories prédites (indices dans classes_)
+        """
+        k = k or self.k
+        alpha = self.alpha if alpha is None else alpha
+        beta = self.beta if beta is None else beta
+        votes = vote_fractions(self.train_codes_[neighbour_indices], len(self.classes_), k)
+        return np.argmax(alpha * centroid_sims + beta * votes, axis=1)
+
+    def predict(self, X):
+        """
+        Catégories prédites.
+
+        Args:
+            X: Embeddings à classer (n, dim)
+
+        Returns:
+            Tableau (n,) des catégories
+        """
+        X = np.asarray(X)
+        codes = self.combine(self.centroid_similarities(X), self.neighbours(X))
+        return self.classes_[codes]
+
+
+# Similarités mises en cache pour le balayage (partagées avec les processus du pool)
+_SWEEP_STATE = {}
+
+
+def _init_sweep(centroid_sims, neighbour_codes, y_codes, n_classes):
+    _SWEEP_STATE.update(
+        centroid_sims=centroid_sims, neighbour_codes=neighbour_codes, y_codes=y_codes, n_classes=n_classes
+    )
+
+
+def classification_metrics(y_true, y_pred):
+    """Accuracy, précision et F1 pondérés (mêmes métriques que analysis_improved.py)."""
+    return {
+        'accuracy': accuracy_score(y_true, y_pred),
+        'precision': precision_score(y_true, y_pred, average='weighted', zero_division=0),
+        'f1': f1_score(y_true, y_pred, average='weighted', zero_division=0)
+    }
+
+
+def _evaluate_point(point):
+    k, alpha, beta = point
+    state = _SWEEP_STATE
+    votes = vote_fractions(state['neighbour_codes'], state['n_classes'], k)
+    y_pred = np.argmax(alpha * state['centroid_sims'] + beta * votes, axis=1)
+    return {'k': k, 'alpha': alpha, 'beta': beta, **classification_metrics(state['y_codes'], y_pred)}
+
+
+def sweep_grid(classifier, X_test, y_test, ks, alphas, betas, workers=1):
+    """
+    Évalue toutes les combinaisons (k, alpha, beta) à partir d'un seul calcul
+    des similarités test x centroïdes et des K_max plus proches voisins.
+
+    Args:
+        classifier: HybridClassifier entraîné (fit)
+        X_test: Embeddings de test (n, dim)
+        y_test: Catégories attendues
+        ks, alphas, betas: Valeurs à balayer
+        workers: Nombre de processus (1 = séquentiel)
+
+    Returns:
+        DataFrame (k, alpha, beta, accuracy, precision, f1), trié par F1 décroissant
+    """
+    X_test = np.asarray(X_test)
+    neighbours = classifier.neighbours(X_test, k=max(ks))
+    state = (
+        classifier.centroid_similarities(X_test),
+        classifier.train_codes_[neighbours],
+        pd.Index(classifier.classes_).get_indexer(np.asarray(y_test)),
+        len(classifier.classes_)
+    )
+    grid = list(itertools.product(ks, alphas, betas))
+
+    if workers > 1:
+        # État envoyé une fois par processus (initializer), pas par point de la grille
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep, initargs=state) as pool:
+            rows = list(pool.map(_evaluate_point, grid, chunksize=max(1, len(grid) // (4 * workers))))
+    else:
+        _init_sweep(*state)
+        rows = [_evaluate_point(point) for point in grid]
+    _SWEEP_STATE.clear()
+
+    return pd.DataFrame(rows).sort_values(['f1', 'accuracy'], ascending=False, kind='stable').reset_index(drop=True)
+
+
+def save_table(table, path):
+    """Écrit le tableau de résultats en CSV, ou en JSON si l'extension est .json."""
+    if os.path.splitext(path)[1].lower() == '.json':
+        table.to_json(path, orient='records', indent=2)
+    else:
+        table.to_csv(path, index=False)
+
+
+# Embeddings et étiquettes de la validation croisée (memmap dans les processus)
+_CV_STATE = {}
+
+
+def _init_cv(embeddings, labels, params, blas_threads=None):
+    if isinstance(embeddings, str):
+        embeddings = np.load(embeddings, mmap_mode='r')
+    if blas_threads:
+        # Évite la sursouscription : un pool BLAS réduit par processus
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(blas_threads)
+    _CV_STATE.update(embeddings=embeddings, labels=labels, params=params)
+
+
+def _evaluate_fold(task):
+    fold, train_idx, test_idx = task
+    X, y = _CV_STATE['embeddings'], _CV_STATE['labels']
+    classifier = HybridClassifier(**_CV_STATE['params']).fit(X[train_idx], y[train_idx])
+    return {'fold': fold, 'train': len(train_idx), 'test': len(test_idx),
+            **classification_metrics(y[test_idx], classifier.predict(X[test_idx]))}
+
+
+def cross_validate(X, y, n_splits=5, k=5, alpha=0.6, beta=0.4, workers=1, random_state=42):
+    """
+    Validation croisée stratifiée du classifieur hybride, plis évalués en parallèle.
+
+    Args:
+        X: Embeddings (n, dim), encodés une seule fois
+        y: Catégories
+        n_splits: Nombre de plis
+        k, alpha, beta: Hyperparamètres du classifieur
+        workers: Nombre de processus (1 = séquentiel)
+        random_state: Graine du découpage (StratifiedKFold mélangé)
+
+    Returns:
+        (DataFrame des métriques par pli, dictionnaire {métrique: (moyenne, écart type)})
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    params = {'k': k, 'alpha': alpha, 'beta': beta}
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    tasks = [(fold, train_idx, test_idx) for fold, (train_idx, test_idx) in enumerate(folds.split(X, y), 1)]
+
+    if workers > 1:
+        # Matrice écrite une fois, mappée en lecture par chaque processus (pas de pickling)
+        workdir = tempfile.mkdtemp(prefix="cv_embeddings_")
+        try:
+            path = os.path.join(workdir, "embeddings.npy")
+            np.save(path, X)
+            blas_threads = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_cv,
+                                     initargs=(path, y, params, blas_threads)) as pool:
+                rows = list(pool.map(_evaluate_fold, tasks))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        _init_cv(X, y, params)
+        rows = [_evaluate_fold(task) for task in tasks]
+    _CV_STATE.clear()
+
+    table = pd.DataFrame(rows)
+    summary = {metric: (float(table[metric].mean()), float(table[metric].std(ddof=1)))
+               for metric in ('accuracy', 'precision', 'f1')}
+    return table, summary
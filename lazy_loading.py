@@ -0,0 +1,67 @@
+"""
+Chargement paresseux du modèle SBERT.
+
+Les points d'entrée importaient sentence_transformers (torch), scikit-learn
+et pandas dès le chargement du module, et construisaient le modèle avant
+même d'afficher le questionnaire. Ces imports sont désormais faits dans les
+fonctions qui les utilisent, et LazySentenceTransformer ne charge le modèle
+qu'au premier encode(), ou en arrière-plan via preload() pendant que
+l'utilisateur répond au questionnaire.
+"""
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class LazySentenceTransformer:
+    """
+    Poignée vers un modèle SentenceTransformer chargé à la demande.
+
+    Expose encode() comme le modèle : le premier appel importe
+    sentence_transformers et construit le modèle (thread-safe).
+
+    Args:
+        model_name: Nom du modèle SBERT
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        """Charge le modèle si nécessaire et le retourne."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._build()
+        return self._model
+
+    def _build(self):
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name)
+
+    def preload(self):
+        """Lance le chargement dans un thread de fond (ex. pendant le questionnaire)."""
+        if self._model is None and self._thread is None:
+            self._thread = threading.Thread(target=self._preload, name="sbert-preload", daemon=True)
+            self._thread.start()
+        return self
+
+    def _preload(self):
+        try:
+            self.load()
+        except Exception as e:
+            # L'erreur sera relevée au premier encode()
+            logger.warning("[SBERT] Préchargement impossible : %s", e)
+
+    def encode(self, *args, **kwargs):
+        return self.load().encode(*args, **kwargs)
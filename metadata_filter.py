@@ -0,0 +1,192 @@
+"""
+Index de métadonnées pour les recherches contraintes.
+
+Construit au chargement du catalogue, dans l'ordre des lignes des embeddings :
+- colonnes NumPy compactes : prix, étoiles, disponibilité, nombre d'avis
+- un bitmap par catégorie (np.packbits, 1 bit par livre)
+
+Les filtres (catégories à éviter, prix maximal, étoiles minimales...) sont
+combinés en un masque booléen d'exclusion (True = livre exclu, convention de
+scoring.top_k_indices), appliqué avant le produit de similarité et le Top K,
+et passé en pré-filtre aux index ANN (ann_index.*.search(exclude=...)).
+"""
+
+import logging
+import math
+import re
+
+import numpy as np
+
+
+# Séparateurs des termes du champ 'avoid' ("horror, romance et poetry")
+AVOID_SEPARATORS = re.compile(r"[,;/+]|\bet\b|\band\b|\bou\b|\bor\b")
+
+# Filtres numériques des préférences et leur type
+NUMERIC_FILTERS = {'max_price': float, 'min_stars': int, 'min_reviews': int}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_filters(preferences):
+    """
+    Convertit les filtres numériques d'un profil de préférences.
+
+    Args:
+        preferences: Dictionnaire (ou formulaire) de préférences
+
+    Returns:
+        Dictionnaire {champ: nombre ou None} pour les clés de NUMERIC_FILTERS
+        (valeurs absentes ou vides -> None)
+
+    Raises:
+        ValueError: Valeur non numérique ou non finie, avec le nom du champ
+    """
+    filters = {}
+    for key, cast in NUMERIC_FILTERS.items():
+        value = preferences.get(key)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            filters[key] = None
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = math.nan
+        if not math.isfinite(number):
+            raise ValueError(f"Filtre {key} invalide : {value!r} (nombre attendu)")
+        filters[key] = cast(number)
+    return filters
+
+
+class MetadataIndex:
+    """
+    Colonnes de métadonnées et bitmaps de catégories du catalogue.
+
+    Args:
+        categories: Catégories nettoyées (minuscules), une par livre
+        price: Prix (float)
+        stars: Nombre d'étoiles (0-5)
+        availability: Exemplaires disponibles
+        reviews: Nombre d'avis
+    """
+
+    def __init__(self, categories, price, stars, availability, reviews):
+        self.n_rows = len(categories)
+        self.category_names, codes = np.unique(np.asarray(categories, dtype=str), return_inverse=True)
+        self.category_codes = codes.astype(np.int16)
+        self.category_bitmaps = np.packbits(
+            self.category_codes[None, :] == np.arange(len(self.category_names))[:, None], axis=1
+        )
+        self.price = np.asarray(price, dtype=np.float32)
+        self.stars = np.asarray(stars, dtype=np.int8)
+        self.availability = np.asarray(availability, dtype=np.int32)
+        self.reviews = np.asarray(reviews, dtype=np.int32)
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def from_catalogue(cls, df):
+        """
+        Construit l'index depuis le catalogue nettoyé (load_catalogue()).
+
+        Args:
+            df: DataFrame nettoyé, dans l'ordre des embeddings
+
+        Returns:
+            MetadataIndex
+        """
+        def column(name, default=0):
+            if name not in df:
+                return np.full(len(df), default)
+            return df[name].fillna(default).to_numpy()
+
+        index = cls(
+            categories=df['genre_clean'].to_numpy(),
+            price=column('Price', np.nan),
+            stars=column('Stars'),
+            availability=column('Avilability'),
+            reviews=column('Number_of_reviews')
+        )
+        logger.info("[Filtres] Index de métadonnées : %d livres, %d catégories",
+                    len(index), len(index.category_names))
+        return index
+
+    def matching_categories(self, avoid):
+        """
+        Catégories citées dans le texte libre 'avoid'.
+
+        Une catégorie correspond si un terme apparaît (mots entiers) dans son
+        nom : "science-fiction" -> "science fiction", "fiction" -> toutes les
+        catégories "... fiction".
+
+        Args:
+            avoid: Texte libre ("horror, romance")
+
+        Returns:
+            Liste des noms de catégories correspondants
+        """
+        text = str(avoid).lower().replace('-', ' ')
+        terms = [term.strip() for term in AVOID_SEPARATORS.split(text) if term.strip()]
+        patterns = [re.compile(rf"\b{re.escape(term)}\b") for term in terms]
+        return [str(name) for name in self.category_names if any(p.search(name) for p in patterns)]
+
+    def category_mask(self, categories):
+        """Masque booléen des livres appartenant à l'une des catégories (OR des bitmaps)."""
+        rows = np.flatnonzero(np.isin(self.category_names, list(categories)))
+        if len(rows) == 0:
+            return np.zeros(self.n_rows, dtype=bool)
+        packed = np.bitwise_or.reduce(self.category_bitmaps[rows], axis=0)
+        return np.unpackbits(packed, count=self.n_rows).astype(bool)
+
+    def exclude_mask(self, avoid=None, max_price=None, min_stars=None, min_reviews=None, in_stock=False):
+        """
+        Masque d'exclusion combinant les filtres fournis.
+
+        Args:
+            avoid: Texte libre des catégories à exclure
+            max_price: Prix maximal (inclus)
+            min_stars: Nombre minimal d'étoiles (inclus)
+            min_reviews: Nombre minimal d'avis (inclus)
+            in_stock: Exclure les livres sans exemplaire disponible
+
+        Returns:
+            Masque booléen (n_livres,), True = livre exclu, ou None sans filtre actif
+        """
+        exclude = None
+
+        def combine(mask):
+            return mask if exclude is None else exclude | mask
+
+        if avoid:
+            categories = self.matching_categories(avoid)
+            if categories:
+                exclude = combine(self.category_mask(categories))
+        if max_price is not None:
+            # Prix inconnu (NaN) : exclu dès qu'un prix maximal est demandé
+            exclude = combine(~(self.price <= max_price))
+        if min_stars is not None:
+            exclude = combine(self.stars < min_stars)
+        if min_reviews is not None:
+            exclude = combine(self.reviews < min_reviews)
+        if in_stock:
+            exclude = combine(self.availability <= 0)
+        return exclude
+
+    def mask_for(self, preferences):
+        """
+        Masque d'exclusion pour un profil de préférences.
+
+        Clés lues : 'avoid', 'max_price', 'min_stars', 'min_reviews', 'in_stock'
+        (les valeurs vides sont ignorées).
+
+        Returns:
+            Masque booléen (n_livres,) ou None sans filtre actif
+
+        Raises:
+            ValueError: Filtre numérique invalide (voir parse_filters)
+        """
+        return self.exclude_mask(
+            avoid=preferences.get('avoid'),
+            **parse_filters(preferences),
+            in_stock=str(preferences.get('in_stock', '')).lower() in ('1', 'true', 'on', 'oui')
+        )
@@ -0,0 +1,189 @@
+"""
+Instrumentation légère : chronométrage des étapes, compteurs et export
+Prometheus (format texte), plus la configuration du logging.
+
+    with timed('encode'):
+        query_emb = ...
+
+Les durées alimentent l'histogramme stage_duration_seconds{stage="encode"}.
+Les compteurs déjà tenus par les caches et le client GenAI (hits, erreurs...)
+sont lus au moment du scrape via des collecteurs (register_collector), sans
+double comptage. render() produit le texte servi par /metrics.
+"""
+
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Bornes des histogrammes de latence (secondes)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Compteur monotone, éventuellement étiqueté (thread-safe)."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes, éventuellement étiqueté (thread-safe)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    labels = _format_labels(self.labels + ('le',), key + (le,))
+                    lines.append((f"{self.name}_bucket", labels, cumulative))
+                lines.append((f"{self.name}_sum", _format_labels(self.labels, key), total))
+                lines.append((f"{self.name}_count", _format_labels(self.labels, key), count))
+        return lines
+
+
+class Registry:
+    """Ensemble des métriques et des collecteurs exportés par render()."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.setdefault(metric.name, metric)
+            return self._metrics[metric.name]
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def register_collector(self, collect):
+        """
+        Ajoute un collecteur appelé à chaque scrape.
+
+        Args:
+            collect: Fonction sans argument retournant une liste de
+                     (nom, type 'counter'|'gauge', aide, valeur)
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        """Métriques au format texte Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {float(value)!r}")
+        for collect in collectors:
+            try:
+                samples = collect()
+            except Exception as e:  # Un collecteur défaillant ne casse pas le scrape
+                logging.getLogger(__name__).warning("Collecteur de métriques en erreur : %s", e)
+                continue
+            for name, kind, help_text, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "stage_duration_seconds", "Durée des étapes du pipeline de recommandation", labels=('stage',)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "stage_errors_total", "Étapes terminées par une exception", labels=('stage',)
+)
+
+
+@contextmanager
+def timed(stage):
+    """Chronomètre un bloc dans stage_duration_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
+
+
+def configure_logging(level=None, fmt="%(message)s"):
+    """
+    Configure le logging racine (idempotent).
+
+    Le niveau vient de LOG_LEVEL (INFO par défaut) ; les messages par livre
+    sont émis en DEBUG et donc masqués par défaut.
+
+    Args:
+        level: Niveau ('DEBUG', 'INFO'...) prioritaire sur LOG_LEVEL
+        fmt: Format des messages (message seul pour la CLI)
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(level=getattr(logging, level, logging.INFO), format=fmt, stream=sys.stdout)
@@ -0,0 +1,209 @@
+"""
+Profilage à la demande des requêtes (cProfile).
+
+Désactivé par défaut. Une requête est profilée si :
+- elle est tirée au sort parmi une fraction PROFILE_SAMPLE_RATE (0.0 à 1.0), ou
+- elle porte l'en-tête X-Profile égal à PROFILE_ADMIN_TOKEN (sans jeton
+  configuré, l'en-tête est ignoré).
+
+Chaque profil est écrit au format pstats dans PROFILE_DIR
+(<nom>_<date>_<durée>ms_<id>.prof) ; seuls les PROFILE_MAX_FILES plus récents
+sont conservés. Un seul profil est capturé à la fois (cProfile n'accepte
+qu'un profileur actif) : les requêtes concurrentes ne sont pas profilées.
+
+Agrégation des fonctions les plus coûteuses :
+    python profiling.py top --limit 25
+    python profiling.py top --slowest 10 --sort tottime
+"""
+
+import argparse
+import cProfile
+import functools
+import glob
+import hmac
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_HEADER = "X-Profile"
+
+PROFILE_NAME = re.compile(r"_(\d+)ms_[0-9a-f]+\.prof$")
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """
+    Profileur cProfile échantillonné, à rétention bornée.
+
+    Args:
+        directory: Dossier des fichiers .prof
+        sample_rate: Fraction des requêtes profilées (0 = aucune)
+        max_files: Nombre maximal de profils conservés
+        admin_token: Valeur attendue de l'en-tête X-Profile ('' = en-tête ignoré)
+    """
+
+    def __init__(self, directory=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE,
+                 max_files=PROFILE_MAX_FILES, admin_token=PROFILE_ADMIN_TOKEN):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.admin_token = admin_token
+        self.captured = 0
+        self.skipped_busy = 0
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.admin_token)
+
+    def should_profile(self, header=None):
+        """Requête à profiler : en-tête administrateur valide ou tirage au sort."""
+        if self.admin_token and header:
+            # Comparaison à temps constant (le jeton ne fuit pas par la durée)
+            if hmac.compare_digest(header.encode('utf-8'), self.admin_token.encode('utf-8')):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def maybe_profile(self, name, header=None):
+        """
+        Profile le bloc si la requête est retenue (sinon, aucun surcoût notable).
+
+        Args:
+            name: Nom de l'étape (préfixe du fichier)
+            header: Valeur de l'en-tête X-Profile de la requête
+        """
+        if not self.should_profile(header):
+            yield
+            return
+        if not self._active.acquire(blocking=False):
+            self.skipped_busy += 1
+            yield
+            return
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        finally:
+            self._active.release()
+            self._save(profiler, name, time.perf_counter() - start)
+
+    def profiled(self, name, get_header=lambda: None):
+        """
+        Décorateur : profile la fonction selon maybe_profile().
+
+        Args:
+            name: Nom de l'étape
+            get_header: Fonction retournant l'en-tête X-Profile de la requête courante
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.maybe_profile(name, get_header()):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _save(self, profiler, name, elapsed):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = f"{name}_{datetime.now():%Y%m%d-%H%M%S}_{elapsed * 1000:.0f}ms_{uuid.uuid4().hex[:8]}.prof"
+            profiler.dump_stats(os.path.join(self.directory, filename))
+            self.captured += 1
+            self._prune()
+        except OSError as e:
+            logger.warning("[Profilage] Écriture du profil impossible : %s", e)
+
+    def _prune(self):
+        """Supprime les profils les plus anciens au-delà de max_files."""
+        files = sorted(list_profiles(self.directory), key=os.path.getmtime)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'captured': self.captured,
+            'skipped_busy': self.skipped_busy,
+            'directory': self.directory
+        }
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Chemins des fichiers .prof du dossier."""
+    return glob.glob(os.path.join(directory, "*.prof"))
+
+
+def profile_duration_ms(path):
+    """Durée de la requête profilée, lue dans le nom du fichier (None si absente)."""
+    match = PROFILE_NAME.search(os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def aggregate_profiles(paths, sort='cumulative', limit=25):
+    """
+    Agrège plusieurs profils et affiche les fonctions les plus coûteuses.
+
+    Args:
+        paths: Fichiers .prof à agréger
+        sort: Clé de tri pstats ('cumulative', 'tottime', 'ncalls'...)
+        limit: Nombre de fonctions affichées
+
+    Returns:
+        pstats.Stats agrégées
+    """
+    stats = pstats.Stats(*paths)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrégation des profils de requêtes (cProfile)")
+    parser.add_argument('command', choices=['top'])
+    parser.add_argument('--dir', default=PROFILE_DIR, help="Dossier des fichiers .prof")
+    parser.add_argument('--name', help="Ne garder que les profils de cette étape (ex. recommend)")
+    parser.add_argument('--slowest', type=int, help="Ne garder que les N requêtes les plus lentes")
+    parser.add_argument('--sort', default='cumulative')
+    parser.add_argument('--limit', type=int, default=25)
+    args = parser.parse_args()
+
+    paths = list_profiles(args.dir)
+    if args.name:
+        paths = [p for p in paths if os.path.basename(p).startswith(f"{args.name}_")]
+    if args.slowest:
+        paths = sorted(paths, key=lambda p: profile_duration_ms(p) or 0, reverse=True)[:args.slowest]
+    if not paths:
+        print(f"[Profilage] Aucun profil dans {args.dir}")
+        return
+
+    durations = [d for d in (profile_duration_ms(p) for p in paths) if d is not None]
+    print(f"[Profilage] {len(paths)} profils agrégés depuis {args.dir}")
+    if durations:
+        print(f"[Profilage] Durées : min {min(durations)} ms, max {max(durations)} ms, "
+              f"moyenne {sum(durations) / len(durations):.0f} ms")
+    aggregate_profiles(paths, args.sort, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cache LRU des embeddings de requêtes, partagé par la CLI et l'application Flask.
+
+build_query_from_preferences() produit des requêtes très répétitives (625
+combinaisons de descripteurs Likert, descriptions souvent vides) : un cache
+borné évite de relancer l'inférence SBERT pour une requête déjà vue.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_store import MODEL_NAME
+
+
+def normalize_query(text):
+    """
+    Normalise le texte d'une requête pour la clé de cache.
+
+    all-MiniLM-L6-v2 ignore la casse et les espaces multiples : deux textes
+    ne différant que par ceux-ci produisent le même embedding.
+
+    Args:
+        text: Texte de la requête
+
+    Returns:
+        Texte en minuscules, espaces normalisés
+    """
+    return " ".join(str(text).lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU borné (TTL optionnel) des embeddings de requêtes.
+
+    La clé est (modèle, texte normalisé). Les compteurs hits/misses sont
+    exposés par stats(). Thread-safe (serveur Flask multi-thread).
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text, model_name=MODEL_NAME):
+        """Retourne l'embedding en cache, ou None (compte un hit ou un miss)."""
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text, embedding, model_name=MODEL_NAME):
+        """Ajoute un embedding (lecture seule) et évince le moins récent si plein."""
+        if self.maxsize <= 0:
+            return
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, text, encode, model_name=MODEL_NAME):
+        """
+        Retourne l'embedding de la requête, en l'encodant si absent du cache.
+
+        Args:
+            text: Texte de la requête
+            encode: Fonction texte -> embedding (appelée seulement en cas de miss)
+            model_name: Identifiant du modèle (fait partie de la clé)
+
+        Returns:
+            Embedding de la requête (dim,)
+        """
+        embedding = self.get(text, model_name)
+        if embedding is None:
+            embedding = encode(text)
+            self.put(text, embedding, model_name)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Compteurs du cache (hits, misses, taux de succès, taille)."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
+
+
+# Cache partagé par la CLI et l'application Flask
+QUERY_CACHE = QueryEmbeddingCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.environ["QUERY_CACHE_TTL"]) if os.getenv("QUERY_CACHE_TTL") else None
+)
+
+
+def encode_query(model, text, cache=QUERY_CACHE, model_name=MODEL_NAME):
+    """
+    Encode une requête via le cache partagé.
+
+    Args:
+        model: Modèle SentenceTransformer
+        text: Texte de la requête
+        cache: Cache à utiliser (QUERY_CACHE par défaut)
+        model_name: Identifiant du modèle
+
+    Returns:
+        Embedding de la requête (dim,)
+    """
+    return cache.get_or_encode(
+        text, lambda t: model.encode(t, convert_to_tensor=False), model_name
+    )
@@ -0,0 +1,270 @@
+"""
+Composition des vecteurs de requête à partir d'embeddings précalculés.
+
+build_query_from_preferences() termine toujours la requête par un
+descripteur par dimension Likert : 4 dimensions x 5 descripteurs, soit 625
+combinaisons. Les descripteurs (ou les 625 combinaisons) sont encodés une
+fois au démarrage ; le vecteur de requête est ensuite composé :
+
+    requête = normalise(w * texte_libre + (1 - w) * descripteurs)
+
+où texte_libre est l'embedding de la description et des livres préférés.
+Sans description ni livres préférés, aucun appel à model.encode.
+
+Modes (QUERY_COMPOSE) :
+    string        chaîne complète encodée (comportement historique)
+    combinations  625 combinaisons précalculées (exact sans texte libre)
+    descriptors   20 descripteurs précalculés, moyennés par combinaison
+
+Comparaison de qualité avec le mode string :
+    python query_composer.py compare --profiles 200 --weights 0.5,0.6,0.7,0.8
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import time
+
+import numpy as np
+
+from embedding_store import MODEL_NAME
+from metrics import configure_logging
+from query_cache import QUERY_CACHE
+from scoring import LIKERT_KEYS, normalize_embeddings, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+
+# Descripteurs textuels des scores Likert 1 à 5 (EF1.1 -> requête sémantique)
+LIKERT_DESCRIPTORS = {
+    'intensity_action': ['calme', 'paisible', 'modéré', 'intense', 'très intense'],
+    'intensity_romance': ['sans romance', 'romance légère', 'romance présente', 'romance importante', 'histoire d\'amour centrale'],
+    'intensity_learning': ['divertissement pur', 'un peu éducatif', 'instructif', 'très éducatif', 'essai pédagogique'],
+    'complexity': ['très simple', 'accessible', 'standard', 'complexe', 'très complexe']
+}
+
+COMPOSE_MODES = ['string', 'combinations', 'descriptors']
+QUERY_COMPOSE = os.getenv("QUERY_COMPOSE", "string")
+FREE_TEXT_WEIGHT = float(os.getenv("QUERY_FREE_TEXT_WEIGHT", "0.6"))
+
+
+def free_text_parts(preferences):
+    """Parties libres de la requête (description, livres préférés)."""
+    parts = []
+    if preferences.get('description'):
+        parts.append(preferences['description'])
+    if preferences.get('favorite_books'):
+        parts.append(f"Livres similaires à : {preferences['favorite_books']}")
+    return parts
+
+
+def combination_index(preferences):
+    """Indice (0-624) de la combinaison de scores Likert."""
+    index = 0
+    for key in LIKERT_KEYS:
+        index = index * 5 + (preferences.get(key, 3) - 1)
+    return index
+
+
+class QueryComposer:
+    """
+    Compose les vecteurs de requête à partir des descripteurs précalculés.
+
+    Args:
+        model: Encodeur SBERT (encode() compatible SentenceTransformer)
+        mode: 'combinations' ou 'descriptors'
+        free_text_weight: Poids w du texte libre dans la composition
+        model_name: Identifiant du modèle (clé du cache des requêtes)
+    """
+
+    def __init__(self, model, mode='combinations', free_text_weight=FREE_TEXT_WEIGHT, model_name=MODEL_NAME):
+        if mode not in ('combinations', 'descriptors'):
+            raise ValueError(f"Mode de composition inconnu : {mode}")
+        self.model = model
+        self.mode = mode
+        self.free_text_weight = free_text_weight
+        self.model_name = model_name
+        self.vectors = None
+        self.encoded = 0
+        self.composed_only = 0
+
+    def precompute(self):
+        """Encode les descripteurs (20) ou les combinaisons (625) une seule fois."""
+        start = time.perf_counter()
+        descriptors = [LIKERT_DESCRIPTORS[key] for key in LIKERT_KEYS]
+        if self.mode == 'combinations':
+            # Même ordre que combination_index() (premier descripteur = poids fort)
+            texts = [". ".join(combo) for combo in itertools.product(*descriptors)]
+        else:
+            texts = [text for values in descriptors for text in values]
+        self.vectors = normalize_embeddings(
+            self.model.encode(texts, convert_to_tensor=False, batch_size=64)
+        )
+        logger.info("[Requêtes] %d vecteurs de descripteurs précalculés (%s) en %.1fs",
+                    len(texts), self.mode, time.perf_counter() - start)
+        return self
+
+    def descriptor_vector(self, preferences):
+        """Vecteur normalisé des descripteurs Likert d'un profil."""
+        if self.vectors is None:
+            self.precompute()
+        if self.mode == 'combinations':
+            return self.vectors[combination_index(preferences)]
+        rows = [i * 5 + preferences.get(key, 3) - 1 for i, key in enumerate(LIKERT_KEYS)]
+        return normalize_embeddings(self.vectors[rows].mean(axis=0))
+
+    def compose(self, preferences, encode=None, free_text_weight=None):
+        """
+        Vecteur de requête composé pour un profil.
+
+        Args:
+            preferences: Dictionnaire des préférences
+            encode: Fonction texte -> embedding pour le texte libre
+                    (par défaut : model.encode via le cache des requêtes)
+            free_text_weight: Surcharge ponctuelle du poids w
+
+        Returns:
+            Embedding normalisé de la requête (dim,)
+        """
+        descriptor_vec = self.descriptor_vector(preferences)
+        parts = free_text_parts(preferences)
+        if not parts:
+            self.composed_only += 1
+            return descriptor_vec
+
+        if encode is None:
+            encode = lambda text: self.model.encode(text, convert_to_tensor=False)
+        self.encoded += 1
+        free_vec = normalize_embeddings(
+            QUERY_CACHE.get_or_encode(". ".join(parts), encode, self.model_name)
+        )
+        weight = self.free_text_weight if free_text_weight is None else free_text_weight
+        return normalize_embeddings(weight * free_vec + (1.0 - weight) * descriptor_vec)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'free_text_weight': self.free_text_weight,
+            'encoded': self.encoded,
+            'composed_only': self.composed_only
+        }
+
+
+def load_composer(model, mode=QUERY_COMPOSE, free_text_weight=FREE_TEXT_WEIGHT):
+    """
+    Retourne le QueryComposer du mode demandé (précalculé), ou None en mode string.
+
+    Args:
+        model: Encodeur SBERT
+        mode: 'string', 'combinations' ou 'descriptors'
+        free_text_weight: Poids w du texte libre
+
+    Returns:
+        QueryComposer ou None
+    """
+    if mode not in COMPOSE_MODES:
+        raise ValueError(f"Mode de composition inconnu : {mode} (attendu : {', '.join(COMPOSE_MODES)})")
+    if mode == 'string':
+        return None
+    return QueryComposer(model, mode, free_text_weight).precompute()
+
+
+def random_profiles(df, n_profiles, seed=0):
+    """
+    Profils de test : scores Likert aléatoires, description tirée du
+    catalogue (titre + catégorie) ou vide, livres préférés parfois renseignés.
+    """
+    rng = random.Random(seed)
+    titles = df['Title'].astype(str).tolist()
+    categories = df['Category'].astype(str).tolist()
+    profiles = []
+    for _ in range(n_profiles):
+        row = rng.randrange(len(titles))
+        kind = rng.random()
+        profile = {key: rng.randint(1, 5) for key in LIKERT_KEYS}
+        profile['description'] = f"{categories[row]} {titles[row]}" if kind < 0.6 else ""
+        profile['favorite_books'] = titles[rng.randrange(len(titles))] if 0.3 < kind < 0.8 else ""
+        profiles.append(profile)
+    return profiles
+
+
+def compare_modes(profiles, model, embeddings, modes=('combinations', 'descriptors'),
+                  weights=(FREE_TEXT_WEIGHT,), top_k=3):
+    """
+    Compare les vecteurs composés au mode string (référence).
+
+    Args:
+        profiles: Profils de préférences
+        model: Encodeur SBERT
+        embeddings: Embeddings normalisés des livres
+        modes: Modes de composition à évaluer
+        weights: Poids w du texte libre à évaluer
+        top_k: Taille du Top K comparé
+
+    Returns:
+        Liste de dictionnaires {'mode', 'weight', 'cosine', 'overlap', 'top1', 'ms_per_query'}
+    """
+    from book_recommendation_system import build_query_from_preferences
+
+    book_matrix = np.asarray(embeddings, dtype=np.float32)
+    texts = [build_query_from_preferences(profile) for profile in profiles]
+    reference = normalize_embeddings(model.encode(texts, convert_to_tensor=False, batch_size=64))
+    reference_top = [top_k_indices(book_matrix @ query, top_k) for query in reference]
+
+    rows = []
+    for mode in modes:
+        composer = QueryComposer(model, mode).precompute()
+        for weight in weights:
+            QUERY_CACHE.clear()
+            start = time.perf_counter()
+            composed = np.stack([composer.compose(profile, free_text_weight=weight) for profile in profiles])
+            elapsed = time.perf_counter() - start
+            cosines = (composed * reference).sum(axis=1)
+            overlaps, top1 = [], []
+            for query, expected in zip(composed, reference_top):
+                found = top_k_indices(book_matrix @ query, top_k)
+                overlaps.append(len(set(found) & set(expected)) / len(expected))
+                top1.append(found[0] == expected[0])
+            rows.append({
+                'mode': mode,
+                'weight': weight,
+                'cosine': float(cosines.mean()),
+                'overlap': float(np.mean(overlaps)),
+                'top1': float(np.mean(top1)),
+                'ms_per_query': 1000 * elapsed / len(profiles)
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qualité des requêtes composées vs chaîne complète")
+    parser.add_argument('command', choices=['compare'])
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--weights', default=str(FREE_TEXT_WEIGHT),
+                        help="Poids du texte libre, séparés par des virgules")
+    parser.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args()
+    configure_logging()
+
+    from book_recommendation_system import load_knowledge_base, load_sbert_and_embeddings
+    from encoder_backend import load_encoder
+
+    df = load_knowledge_base()
+    model, embeddings = load_sbert_and_embeddings(df, model=load_encoder(MODEL_NAME))
+    profiles = random_profiles(df, args.profiles)
+    weights = [float(w) for w in args.weights.split(',')]
+
+    rows = compare_modes(profiles, model, embeddings, weights=weights, top_k=args.top_k)
+    print("\n" + "=" * 80)
+    print(f"  REQUÊTES COMPOSÉES vs CHAÎNE COMPLÈTE ({len(profiles)} profils, Top {args.top_k})")
+    print("=" * 80)
+    print(f"{'Mode':15} {'w':>5} {'Cosinus':>9} {'Recouvr.':>9} {'Top-1':>7} {'ms/req':>8}")
+    for row in rows:
+        print(f"{row['mode']:15} {row['weight']:5.2f} {row['cosine']:9.4f} {row['overlap']:9.1%} "
+              f"{row['top1']:7.1%} {row['ms_per_query']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
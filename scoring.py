@@ -0,0 +1,187 @@
+"""
+Moteur de scoring vectorisé pour le système de recommandation de livres.
+Calcule le score pondéré (EF3.1) de tout le catalogue en un seul produit matrice-vecteur.
+"""
+
+import numpy as np
+
+from metrics import timed
+
+
+# Pondération du score final (EF3.1) : 80% similarité + 20% intensité
+SIMILARITY_WEIGHT = 0.8
+INTENSITY_WEIGHT = 0.2
+
+LIKERT_KEYS = ('intensity_action', 'intensity_romance', 'intensity_learning', 'complexity')
+
+# Pré-filtre : en dessous de cette fraction de livres autorisés, seules leurs
+# lignes sont extraites puis multipliées ; au-dessus, le produit complet suivi
+# du masque au Top K coûte moins cher que la copie des lignes
+GATHER_MAX_FRACTION = 0.3
+
+
+def normalize_embeddings(embeddings):
+    """
+    Normalise (L2) les lignes de la matrice d'embeddings.
+
+    À appeler une seule fois au chargement : le produit scalaire entre
+    vecteurs normalisés est alors égal à la similarité cosinus.
+    Les lignes nulles restent nulles (similarité 0, comme sklearn).
+
+    Args:
+        embeddings: Matrice (n_livres, dim) ou vecteur (dim,)
+
+    Returns:
+        Tableau float32 contigu de même forme, lignes de norme 1
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def scoring_matrix(embeddings):
+    """
+    Matrice des livres au format du produit de similarité (float32).
+
+    À appeler une seule fois au chargement : avec un store float16, NumPy
+    reconvertirait sinon toute la matrice en float32 à chaque requête
+    (et un produit float16 x float16 est encore plus lent). Un store
+    float32 est retourné tel quel (memmap, sans copie).
+
+    Args:
+        embeddings: Matrice (n_livres, dim), par exemple le store mappé
+
+    Returns:
+        embeddings si déjà float32, sinon une copie float32 en mémoire
+    """
+    if embeddings.dtype == np.float32:
+        return embeddings
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def likert_intensity(preferences):
+    """
+    Moyenne des scores Likert normalisée entre 0 et 1 (EF3.1).
+
+    Args:
+        preferences: Dictionnaire des préférences utilisateur
+
+    Returns:
+        Intensité moyenne (float)
+    """
+    return float(np.mean([preferences.get(key, 3) for key in LIKERT_KEYS])) / 5.0
+
+
+def weighted_scores(similarities, preferences):
+    """
+    EF3.1 : Applique la pondération 80% similarité + 20% intensité.
+
+    Args:
+        similarities: Similarités cosinus (catalogue complet ou candidats ANN)
+        preferences: Dictionnaire des préférences (scores Likert)
+
+    Returns:
+        Tableau des scores pondérés, dans l'ordre des similarités
+    """
+    return SIMILARITY_WEIGHT * np.asarray(similarities) + INTENSITY_WEIGHT * likert_intensity(preferences)
+
+
+def score_catalogue(query_emb, book_matrix, preferences):
+    """
+    EF3.1 : Score pondéré de tous les livres en un seul passage.
+
+    Similarité cosinus de chaque livre (produit scalaire des vecteurs
+    normalisés) pondérée par weighted_scores(), sans boucle Python : le terme
+    Likert est calculé une fois par requête.
+
+    Args:
+        query_emb: Embedding de la requête (dim,)
+        book_matrix: Embeddings des livres normalisés par normalize_embeddings()
+        preferences: Dictionnaire des préférences (scores Likert)
+
+    Returns:
+        Tableau (n_livres,) des scores pondérés, dans l'ordre du catalogue
+    """
+    query = normalize_embeddings(query_emb)
+    return weighted_scores(book_matrix @ query, preferences)
+
+
+def top_k_indices(scores, top_k, exclude=None):
+    """
+    EF3.2 : Sélection partielle des top_k meilleurs scores.
+
+    Partition en O(n) (np.argpartition) puis tri des seuls top_k gagnants,
+    au lieu de trier tout le catalogue. À score égal, l'indice de ligne le
+    plus petit passe en premier.
+
+    Args:
+        scores: Tableau (n_livres,) des scores
+        top_k: Nombre de livres à retourner
+        exclude: Masque booléen optionnel (n_livres,), True = livre exclu
+
+    Returns:
+        Indices des top_k livres, triés par score décroissant
+    """
+    scores = np.asarray(scores)
+    candidates = np.arange(len(scores))
+    if exclude is not None:
+        candidates = np.flatnonzero(~np.asarray(exclude, dtype=bool))
+        scores_view = scores[candidates]
+    else:
+        scores_view = scores
+
+    top_k = min(int(top_k), len(candidates))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if top_k < len(candidates):
+        # Seuil = k-ième meilleur score ; les ex-aequo au seuil sont départagés par indice
+        threshold = scores_view[np.argpartition(-scores_view, top_k - 1)[top_k - 1]]
+        above = np.flatnonzero(scores_view > threshold)
+        ties = np.flatnonzero(scores_view == threshold)[:top_k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(candidates))
+
+    order = np.lexsort((selected, -scores_view[selected]))
+    return candidates[selected[order]]
+
+
+def top_k_scores(query_emb, book_matrix, preferences, top_k, exclude=None):
+    """
+    EF3.1 + EF3.2 avec pré-filtre : seuls les livres non exclus sont scorés.
+
+    Filtre sélectif (moins de GATHER_MAX_FRACTION des livres autorisés) :
+    seules les lignes autorisées sont multipliées. Sinon, le catalogue entier
+    est scoré et le masque est appliqué à la sélection du Top K.
+
+    Args:
+        query_emb: Embedding de la requête (dim,)
+        book_matrix: Embeddings des livres normalisés
+        preferences: Dictionnaire des préférences (scores Likert)
+        top_k: Nombre de livres à retourner
+        exclude: Masque booléen optionnel (n_livres,), True = livre exclu
+
+    Returns:
+        Tuple (indices, scores pondérés) triés par score décroissant
+    """
+    candidates = None
+    if exclude is not None:
+        exclude = np.asarray(exclude, dtype=bool)
+        candidates = np.flatnonzero(~exclude)
+        if len(candidates) > GATHER_MAX_FRACTION * len(exclude):
+            candidates = None
+
+    if candidates is None:
+        with timed('score'):
+            scores = score_catalogue(query_emb, book_matrix, preferences)
+        with timed('top_k'):
+            indices = top_k_indices(scores, top_k, exclude)
+        return indices, scores[indices]
+
+    with timed('score'):
+        scores = score_catalogue(query_emb, book_matrix[candidates], preferences)
+    with timed('top_k'):
+        best = top_k_indices(scores, top_k)
+    return candidates[best], scores[best]
@@ -0,0 +1,97 @@
+"""
+Rapport du temps de démarrage des points d'entrée (python -X importtime).
+
+Chaque module est importé dans un processus neuf ; la sortie de
+-X importtime est agrégée par module de premier niveau. Avec --max-ms, le
+script échoue (code 1) si un point d'entrée dépasse le budget : utilisable
+en CI pour détecter une régression (ex. réintroduction d'un import de torch).
+
+Utilisation :
+    python startup_report.py
+    python startup_report.py --max-ms 500 --json startup.json
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+
+ENTRY_POINTS = ['book_recommendation_system', 'app', 'data_cleaning']
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module, python=sys.executable):
+    """
+    Importe un module dans un processus neuf avec -X importtime.
+
+    Args:
+        module: Nom du module à importer
+        python: Interpréteur à utiliser
+
+    Returns:
+        Dictionnaire {'module', 'total_ms', 'top': [(package, cumulé_ms), ...]}
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import de {module} impossible :\n{result.stderr[-2000:]}")
+
+    # importtime affiche les enfants avant leur parent : les imports directs
+    # du module (indentation 3) précèdent sa propre ligne (indentation 1)
+    total_ms, children, pending = 0.0, [], []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        name, cumulative_ms, depth = match.group(4), int(match.group(2)) / 1000.0, len(match.group(3))
+        if depth == 3:
+            pending.append((name, round(cumulative_ms, 1)))
+        elif depth == 1:
+            if name == module:
+                total_ms, children = cumulative_ms, pending
+            pending = []
+
+    return {
+        'module': module,
+        'total_ms': round(total_ms, 1),
+        'top': sorted(children, key=lambda item: -item[1])[:10]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport du temps d'import des points d'entrée")
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help="Budget par point d'entrée ; code de sortie 1 si dépassé")
+    parser.add_argument('--json', dest='json_path', default=None,
+                        help="Écrit le rapport au format JSON")
+    args = parser.parse_args()
+
+    reports = [measure_imports(module) for module in args.modules]
+
+    print("=" * 80)
+    print("  RAPPORT DE DÉMARRAGE (python -X importtime)")
+    print("=" * 80)
+    failed = False
+    for report in reports:
+        over = args.max_ms is not None and report['total_ms'] > args.max_ms
+        failed = failed or over
+        print(f"\n{report['module']:40} {report['total_ms']:10.1f} ms{'  [BUDGET DÉPASSÉ]' if over else ''}")
+        for name, ms in report['top']:
+            print(f"   {name:37} {ms:10.1f} ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+        print(f"\n[OK] Rapport sauvegardé dans {args.json_path}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Lecture stricte des profils JSONL des recommandations par lot."""
+
+import pytest
+
+from batch_recommend import read_profiles
+
+
+def test_read_profiles_skips_only_blank_lines():
+    profiles = read_profiles(['{"description": "dark", "complexity": "9"}', '', '{"user_id": 7}'])
+    assert [profile.get('user_id') for profile in profiles] == [None, 7]
+    assert profiles[0]['complexity'] == 5
+
+
+@pytest.mark.parametrize('line', ['{"description": ', '["dark"]', '{"max_price": "abc"}'])
+def test_read_profiles_reports_line_number(line):
+    with pytest.raises(ValueError, match='Ligne 3'):
+        read_profiles(['{"description": "dark"}', '', line])
+
+
+def test_batch_route_rejects_malformed_line():
+    from app import app
+
+    response = app.test_client().post('/recommend/batch', data='{"description": "dark"}\n{oops\n')
+    assert response.status_code == 400
+    assert 'Ligne 2' in response.get_json()['error']
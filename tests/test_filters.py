@@ -0,0 +1,32 @@
+"""Validation des filtres numériques (prix maximal, note minimale)."""
+
+import pytest
+
+from batch_recommend import parse_profiles
+from metadata_filter import parse_filters
+
+
+def test_parse_filters_converts_numbers_and_ignores_empty_values():
+    filters = parse_filters({'max_price': '12.5', 'min_stars': '4', 'min_reviews': ''})
+    assert filters == {'max_price': 12.5, 'min_stars': 4, 'min_reviews': None}
+
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'inf'])
+def test_parse_filters_rejects_non_numeric_values(value):
+    with pytest.raises(ValueError, match='max_price'):
+        parse_filters({'max_price': value})
+
+
+def test_parse_profiles_reports_invalid_filter():
+    with pytest.raises(ValueError, match='Profil 1'):
+        parse_profiles([{'max_price': 10}, {'min_stars': 'beaucoup'}])
+
+
+def test_recommend_rejects_non_numeric_price():
+    from app import app
+
+    response = app.test_client().post('/recommend', data={'description': 'dark', 'max_price': 'abc'})
+    assert response.status_code == 400
+    payload = response.get_json()
+    assert payload['success'] is False
+    assert 'max_price' in payload['error']
@@ -0,0 +1,32 @@
+"""Export et import des historiques JSONL."""
+
+import json
+
+import pytest
+
+import history_store
+
+
+def test_export_refuses_to_overwrite_legacy_history(tmp_path):
+    log_path = tmp_path / "user_preferences.jsonl"
+    log_path.write_text('{"description": "dark"}\n', encoding='utf-8')
+    legacy_path = tmp_path / history_store.PREFERENCES_JSON
+    legacy_path.write_text('[{"description": "ancien"}]', encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        history_store.export_json(str(log_path), str(legacy_path))
+    assert json.loads(legacy_path.read_text(encoding='utf-8')) == [{"description": "ancien"}]
+
+    export_path = tmp_path / history_store.PREFERENCES_EXPORT
+    assert history_store.export_json(str(log_path), str(export_path)) == 1
+
+
+def test_compact_imports_legacy_once(tmp_path):
+    log_path = tmp_path / "user_preferences.jsonl"
+    log_path.write_text('{"description": "dark"}\n', encoding='utf-8')
+    legacy_path = tmp_path / history_store.PREFERENCES_JSON
+    legacy_path.write_text('[{"description": "ancien"}, {"description": "dark"}]', encoding='utf-8')
+
+    assert history_store.compact(str(log_path), str(legacy_path)) == 2
+    assert not legacy_path.exists()
+    assert history_store.compact(str(log_path), str(legacy_path)) == 2